@@ -0,0 +1,85 @@
+"""
+Benchmark of MCCdaq.daq_load_signals on the simulated DAQ board (crossbill.daqsim), no hardware needed.
+
+Times the generation of new signals (no cache, no waveform store) as the DSLM sampling (points_per_ramp) and the
+signal length (1/VPS) grow, next to the per-sample voltage to DAC code loop daq_load_signals used before it converted
+all samples in a single numpy pass (crossbill.waveform.volts_to_codes). The time per point of the numpy pass stays flat,
+so loading stays in the ms range where the per-sample loop took seconds.
+    python benchmarks/daq_load_signals.py
+Needs numpy, emoji and the mcculw package (only its enums are used on the simulated board).
+
+MIT License
+
+Copyright (c) 2021 Manish Kumar
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os, sys, time
+os.environ['CROSSBILL_DAQ'] = 'sim' #simulated board, set before crossbill.daq gets imported
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import numpy as np
+from crossbill.daq import MCCdaq
+
+FPS = 80 #80 Hz DSLM sweeps (Prime95B), i.e. points_per_ramp*80 points/s per channel
+POINTS_PER_RAMP = [100, 200, 600, 1200] #1200: 96 kS/s per channel, the USB-3101FS limit
+VPS = [1, 0.5, 0.2, 0.1] #1 to 10 s long signals
+REPEAT = 5
+LOOP_SAMPLES = 20000 #samples converted by the per-sample loop, its time is extrapolated to the signal length
+
+class Bench(MCCdaq):
+    def __init__(self):
+        self.msg = ''
+        MCCdaq.__init__(self)
+
+def load_time(daq, points_per_ramp, VPS):
+    """
+    Best time (s) of loading a newly generated signal, and its number of points
+    """
+    best = float('inf')
+    for _ in range(REPEAT):
+        daq.daq_cache.clear() #generate every time
+        daq.daq_params = None #no in-place patching
+        start = time.perf_counter()
+        daq.daq_load_signals(3.0, 0.5, VPS, 2.0, -0.3, FPS, 1.5, points_per_ramp, True)
+        best = min(best, time.perf_counter() - start)
+        daq.daq_free_memory()
+    return best, daq.num_points
+
+def loop_time_per_point():
+    """
+    Time (s) per sample of the per-sample conversion used before: data_array[i] = int(around(32768 + signals[i]*3061.8))
+    """
+    signals = np.random.uniform(-5, 5, LOOP_SAMPLES)
+    data_array = np.empty(LOOP_SAMPLES, dtype=np.uint16)
+    start = time.perf_counter()
+    for i in range(LOOP_SAMPLES):
+        data_array[i] = int(np.around(32768 + signals[i]*3061.8))
+    return (time.perf_counter() - start)/LOOP_SAMPLES
+
+if __name__ == '__main__':
+    daq = Bench()
+    daq.daq_connectboard(0)
+    daq.daq_store = None #no waveform store: generate every signal
+    per_point_loop = loop_time_per_point()
+    print(f"{'points/ramp':>11} {'VPS':>5} {'points':>9} {'load ms':>9} {'ns/point':>9} {'old loop ms':>12}")
+    for points_per_ramp in POINTS_PER_RAMP:
+        for vps in VPS:
+            seconds, num_points = load_time(daq, points_per_ramp, vps)
+            print(f'{points_per_ramp:>11} {vps:>5} {num_points:>9} {seconds*1e3:>9.2f} {seconds/num_points*1e9:>9.2f} {per_point_loop*num_points*1e3:>12.0f}')
+    daq.daq_disconnect()
@@ -0,0 +1,38 @@
+/*
+ * Stub of the MCL MicroDrive DLL (functions used by crossbill.stage.MCL_MicroDrive, signatures of MicroDrive.h)
+ * for benchmarks/stage_calls.py: every call returns at once, moves only update the position counters.
+ * Built by the benchmark with: cc -shared -fPIC -O2 -o libmclstub.so mcl_stub.c
+ */
+static int pos[4];
+static const double microstep = 0.000095; /* mm */
+
+int MCL_InitHandle(void) {return 1;}
+int MCL_GetSerialNumber(int handle) {return 1234;}
+int MCL_GetFirmwareVersion(short *version, short *profile, int handle) {*version = 1; *profile = 2; return 0;}
+void MCL_DLLVersion(short *version, short *revision) {*version = 3; *revision = 4;}
+int MCL_GetFullStepSize(double *stepSize, int handle) {*stepSize = 0.0015; return 0;}
+int MCL_MDInformation(double *encoderResolution, double *stepSize, double *maxVelocity, double *maxVelocityTwoAxis,
+                      double *maxVelocityThreeAxis, double *minVelocity, int handle)
+{
+    *encoderResolution = 0; *stepSize = microstep; *maxVelocity = 4; *maxVelocityTwoAxis = 3; *maxVelocityThreeAxis = 2;
+    *minVelocity = 0.01;
+    return 0;
+}
+void MCL_ReleaseHandle(int handle) {}
+int MCL_MDStop(unsigned short *status, int handle) {*status = 0; return 0;}
+int MCL_MicroDriveWait(int handle) {return 0;}
+int MCL_MDCurrentPositionM(unsigned int axis, int *microSteps, int handle) {*microSteps = pos[axis & 3]; return 0;}
+int MCL_MDMove(unsigned int axis, double velocity, double distance, int handle)
+{
+    pos[axis & 3] += (int)(distance/microstep);
+    return 0;
+}
+int MCL_MDMoveThreeAxes(unsigned int axis1, double velocity1, double distance1, unsigned int axis2, double velocity2,
+                        double distance2, unsigned int axis3, double velocity3, double distance3, int handle)
+{
+    pos[axis1 & 3] += (int)(distance1/microstep);
+    pos[axis2 & 3] += (int)(distance2/microstep);
+    pos[axis3 & 3] += (int)(distance3/microstep);
+    return 0;
+}
+int MCL_MDSingleStep(unsigned int axis, int direction, int handle) {pos[axis & 3] += direction; return 0;}
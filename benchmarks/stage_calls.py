@@ -0,0 +1,138 @@
+"""
+Micro-benchmark of the MCL_MicroDrive calls run after every stage move (position read, move submission)
+against a stub of the MCL DLL (benchmarks/mcl_stub.c, calls return at once), so only the Python/ctypes side is timed.
+
+Compares MCL_MicroDrive, whose DLL functions are bound once (see crossbill.stage._mcl_prototypes, MCL_MicroDrive._stage_bind)
+and whose output buffers are reused through prebuilt byref references, with the per-call setup used before
+(OldCallsStage below: new ctypes objects for every argument and output, default argument conversion, del afterwards).
+    python benchmarks/stage_calls.py [stub library]
+Without a stub library, mcl_stub.c gets built with cc (Linux/macOS). Needs the emoji package (imported by crossbill.stage).
+
+MIT License
+
+Copyright (c) 2021 Manish Kumar
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os, sys, ctypes, subprocess, tempfile, timeit
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..', 'src'))
+from crossbill.stage import MCL_MicroDrive
+
+NUMBER = 50000 #calls per timing
+REPEAT = 9 #best of
+
+def build_stub():
+    """
+    Build mcl_stub.c into a temporary shared library, returns its path
+    """
+    library = os.path.join(tempfile.mkdtemp(), 'libmclstub.so')
+    subprocess.check_call(['cc', '-shared', '-fPIC', '-O2', '-o', library, os.path.join(here, 'mcl_stub.c')])
+    return library
+
+class StubStage(MCL_MicroDrive):
+    """
+    MCL_MicroDrive on the stub DLL
+    """
+    def __init__(self, library):
+        windll = getattr(ctypes, 'WinDLL', None)
+        ctypes.WinDLL = lambda path: ctypes.CDLL(library) #MCL_MicroDrive.__init__ loads MicroDrive.dll with WinDLL
+        try:
+            MCL_MicroDrive.__init__(self)
+        finally:
+            if windll is None:
+                del ctypes.WinDLL
+            else:
+                ctypes.WinDLL = windll
+
+class OldCallsStage(StubStage):
+    """
+    Per-call setup of the stage calls before the DLL got bound with prototypes, on a DLL handle without prototypes
+    """
+    def __init__(self, library):
+        StubStage.__init__(self, library)
+        self.MCLMicroDriveDll = ctypes.CDLL(library) #separate handle: functions without argtypes/restype
+
+    def stage_getcurrentposition(self):
+        YmicroSteps = ctypes.pointer(ctypes.c_int())
+        XmicroSteps = ctypes.pointer(ctypes.c_int())
+        Yaxis = ctypes.c_uint(1)
+        Xaxis = ctypes.c_uint(2)
+        errorNum = self.MCLMicroDriveDll.MCL_MDCurrentPositionM(Xaxis, XmicroSteps, self.stage_handle)
+        if errorNum != 0:
+            self.msg += '\n\n\U000026A0 Error while locating X position: ' + self.errorDictionary[errorNum]
+        errorNum = self.MCLMicroDriveDll.MCL_MDCurrentPositionM(Yaxis, YmicroSteps, self.stage_handle)
+        if errorNum != 0:
+            self.msg += '\n\n\U000026A0 Error while locating Y position: ' + self.errorDictionary[errorNum]
+        self.stage_YXposition[0] = round(float(YmicroSteps.contents.value*self.MicroStepSize - self.Yoffset),5)
+        self.stage_YXposition[1] = round(float(XmicroSteps.contents.value*self.MicroStepSize - self.Xoffset),5)
+        del Xaxis, Yaxis, errorNum, XmicroSteps, YmicroSteps
+
+    def stage_moveYX(self, y, x, velocity):
+        if abs(x) < self.MicroStepSize:
+            x = self.MicroStepSize
+        if abs(y) < self.MicroStepSize:
+            y = self.MicroStepSize
+        x = float(x*1e-3)
+        y = float(y*1e-3)
+        try:
+            errorNum = self.MCLMicroDriveDll.MCL_MDMoveThreeAxes(ctypes.c_uint(2),ctypes.c_double(velocity), ctypes.c_double(x),
+                                                ctypes.c_uint(1),ctypes.c_double(velocity), ctypes.c_double(y),
+                                                ctypes.c_uint(3),ctypes.c_double(velocity), ctypes.c_double(0), self.stage_handle)
+            if errorNum != 0:
+                self.msg += '\n\n\U000026A0 Error while moving: ' + self.errorDictionary[errorNum]
+            del errorNum
+            self.stage_getcurrentposition()
+        except:
+            self.msg += '\n\n\U000026A0 Error: Invalid entry for moving stage or connection lost!'
+
+    def stage_moveY(self, y, velocity):
+        y = float(y*1e-3)
+        try:
+            errorNum = self.MCLMicroDriveDll.MCL_MDMove(ctypes.c_uint(1),ctypes.c_double(velocity), ctypes.c_double(y), self.stage_handle)
+            if errorNum != 0:
+                self.msg += '\n\n\U000026A0 Error while moving: ' + self.errorDictionary[errorNum]
+            del errorNum
+        except:
+            self.msg += '\n\n\U000026A0 Error in moving stage along Y-axis/axis-1 or connection lost!'
+
+def best_time(function):
+    """
+    Best time per call in µs
+    """
+    return min(timeit.repeat(function, number=NUMBER, repeat=REPEAT))/NUMBER*1e6
+
+if __name__ == '__main__':
+    library = sys.argv[1] if len(sys.argv) > 1 else build_stub()
+    stages = {'per-call setup': OldCallsStage(library), 'prebound/reused': StubStage(library)}
+    for stage in stages.values():
+        stage.stage_connect()
+        if '\U000026A0' in stage.msg:
+            sys.exit(stage.msg)
+    calls = {
+        'stage_getcurrentposition': lambda stage: stage.stage_getcurrentposition,
+        'stage_moveY': lambda stage: (lambda: stage.stage_moveY(10.0, 2.0)),
+        'stage_moveYX': lambda stage: (lambda: stage.stage_moveYX(10.0, 5.0, 2.0)),
+    }
+    print(f"{'call':<26}" + ''.join(f'{name:>18}' for name in stages) + f"{'speed-up':>10}")
+    for call, bind in calls.items():
+        times = [best_time(bind(stage)) for stage in stages.values()]
+        print(f'{call:<26}' + ''.join(f'{t:>15.2f} µs' for t in times) + f'{times[0]/times[1]:>9.2f}x')
+    for stage in stages.values():
+        stage.stage_disconnect()
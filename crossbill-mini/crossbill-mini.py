@@ -28,9 +28,12 @@ SOFTWARE.
 from PyQt5 import QtCore, QtGui, QtWidgets
 from crossbillUI import Ui_MainWindow
 #from crossbillcfgUI import Ui_cfgDialog
-from crossbill.stage import MCL_MicroDrive
+from crossbill.stage import MCL_MicroDrive, Waypoint
 from crossbill.daq import MCCdaq
-import math, re, json, numpy, traceback, emoji, traceback
+from crossbill.camera import CameraProfile
+from crossbill.instrument import CallRecorder
+from crossbill import scanplan
+import math, re, json, numpy, traceback, emoji, traceback, threading, contextlib, os
 from datetime import datetime 
 
 class WorkerSignals(QtCore.QObject):
@@ -40,6 +43,18 @@ class WorkerSignals(QtCore.QObject):
     finished = QtCore.pyqtSignal()
     error = QtCore.pyqtSignal()  
 
+class DAQStatusSignals(QtCore.QObject):
+    '''
+    Carries DAQ progress (crossbill.daq.DAQStatus) from the DAQ status publisher thread to the GUI thread.
+    '''
+    status = QtCore.pyqtSignal(object)
+
+class StageTileSignals(QtCore.QObject):
+    '''
+    Carries a structural imaging tile reached by the stage motion queue (driver thread) to the GUI thread, which starts its DAQ sweep.
+    '''
+    tile = QtCore.pyqtSignal(int)
+
 class Worker(QtCore.QRunnable):
     '''
     Worker thread.
@@ -83,6 +98,18 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
         self.UItimer.start()
 
         self.msg = ""
+        self.camprofile = CameraProfile() #rolling shutter timing for DSLM, Prime95B unless loaded from CFG file
+        self.daqtrigger = "software" #DAQ start: "software", "external" (TTL) or "retrigger" (one volume per TTL), from CFG file
+        self.daqgroups = None #multi-board DAQ from CFG file, e.g. [[0, [0, 1]], [1, [2, 3]]]: galvos on board 0, trigger & laser on board 1
+        self.daqsyncbit = 0 #digital bit of the first board wired to TRIG input of all boards
+        self.daqstore = os.path.join(os.path.expanduser("~"), ".crossbill", "waveforms") #generated DAQ signals kept across restarts, "" disables, from CFG file
+        self.daqstoremb = 2048 #disk space limit of the waveform store in MB, from CFG file
+        self.stagesamplerate = 0 #stage position samples per second (0: no sampling), trajectory saved with structural imaging, from CFG file
+        self.scanorder = "serpentine" #tile order of structural imaging, a key of crossbill.scanplan.PLANNERS, from CFG file
+        self.structuraltiles = [] #tiles of the running structural imaging in acquisition order (crossbill.scanplan.Tile)
+        self.structuraltilelog = [] #(Tile, stage position reached, time.perf_counter) of each imaged tile
+        self.tracefile = os.environ.get("CROSSBILL_TRACE") #opt-in tracing of DAQ/stage calls, Chrome trace saved to this file on exit
+        self.tracer = CallRecorder() if self.tracefile else None
 
         self.threadpool = QtCore.QThreadPool()
         self.threadpool.setExpiryTimeout(50) #expiry time in ms for unused threads
@@ -132,10 +159,18 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
         self.laser_comboBox.activated.connect(lambda: self.pushnewdaqsignal(True))
 
         self.daqthread_count = 0
+        self.daqthread_cv = threading.Condition() #notifies threads waiting for a change of daqthread_count
+        self.daqsweeps = None #exact number of sweeps to push instead of single/continuous scan (functional imaging)
+        self.daqstatus_signals = DAQStatusSignals()
+        self.daqstatus_signals.status.connect(self.updatedaqstatus)
 
 
         ############## Stage UI initialization ##############
        
+        self.stagetile_signals = StageTileSignals()
+        self.stagetile_signals.tile.connect(self.startstructuraltile)
+        self.structuraltile_started = threading.Event() #set by startstructuraltile (GUI thread) once the DAQ sweep of a tile is started or skipped
+        self.structuraltile_ok = False #DAQ sweep of the tile was started
         self.connect_stage_pushButton.pressed.connect(self.connectvsdisconnectstage)
         self.recenter_pushButton.pressed.connect(self.recenterstage)
         self.recenter_pushButton.setEnabled(False)
@@ -228,6 +263,8 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
                 self.widthpx = abs(int(self.widthpx_lineEdit.text()))
                 if self.widthpx > 6000:
                         QtWidgets.QMessageBox.about(self, "Warning! Unusually large entry detected.", "Did you mean to enter such a large number of pixels along width? Check again ...")
+                if self.widthpx > 0:
+                    self.camprofile.rows = self.widthpx #rolling shutter runs along camera width
             except:
                 self.widthpx = None
                 QtWidgets.QMessageBox.about(self, "Error! Invalid entry detected.", "Enter a positive integer value ...")
@@ -385,6 +422,17 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
                 self.SL1_lineEdit.setText(str(cfg_dict["sl1fl"]))
                 self.SL2_lineEdit.setText(str(cfg_dict["sl2fl"]))
                 self.SL3_lineEdit.setText(str(cfg_dict["sl3fl"]))
+                self.camprofile = CameraProfile.from_cfg(cfg_dict) #optional entries, older files load as Prime95B
+                self.daqtrigger = cfg_dict.get("daq_trigger", "software")
+                self.daqgroups = cfg_dict.get("daq_groups")
+                self.daqsyncbit = cfg_dict.get("daq_sync_bit", 0)
+                self.daqstore = cfg_dict.get("daq_store", self.daqstore)
+                self.daqstoremb = cfg_dict.get("daq_store_mb", self.daqstoremb)
+                self.stagesamplerate = cfg_dict.get("stage_sample_rate", 0)
+                self.scanorder = cfg_dict.get("scan_order", "serpentine")
+                if self.scanorder not in scanplan.PLANNERS:
+                    self.msg += f'\U000026A0 Unknown scan_order "{self.scanorder}" in the CFG file (one of {", ".join(scanplan.PLANNERS)}). Using serpentine.\n'
+                    self.scanorder = "serpentine"
                 QtWidgets.QMessageBox.about(self, "Remember!", "Verify form entries and click Done button ...")
             except:
                 QtWidgets.QMessageBox.about(self, "Error!", "Could not load the .json file. Retry ...")
@@ -425,6 +473,15 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
                     "tl2fl": self.tl2fl,
                     "tl3fl": self.tl3fl
                     }
+        cfg_dict.update(self.camprofile.to_cfg())
+        cfg_dict["daq_trigger"] = self.daqtrigger
+        cfg_dict["daq_store"] = self.daqstore
+        cfg_dict["daq_store_mb"] = self.daqstoremb
+        cfg_dict["stage_sample_rate"] = self.stagesamplerate
+        cfg_dict["scan_order"] = self.scanorder
+        if self.daqgroups:
+            cfg_dict["daq_groups"] = self.daqgroups
+            cfg_dict["daq_sync_bit"] = self.daqsyncbit
         # print(cfg_dict) #print dictionary
         # save the disctionary as a .json file
         filename,_ = QtWidgets.QFileDialog.getSaveFileName(None, 'Save As', '', "JSON Files (*.json);;All Files (*)")
@@ -447,6 +504,8 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
         #change tab and enable fields
         self.tabWidget.setCurrentIndex(1)
         self.imaging_mode_groupBox.setEnabled(True)
+        if self.connect_daq_pushButton.text() == 'Disconnect':
+            self.precompiledaqsignals() #galvo/camera parameters may have changed
 
 
         # self.close() #close dialog window
@@ -474,9 +533,14 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
     def initdaq(self):
         self.msg += "Identifying DAQ board ...\n"
         MCCdaq.__init__(self) # run DAQ __init__ method
-        self.daqthread_count = 0 #A variable to keep track of DAQ threadcount
+        with self.daqthread_cv:
+            self.daqthread_count = 0 #A variable to keep track of DAQ threadcount
         self.loadnewdaqsignalflag = True #a flag to enable loading of a new signal in system memory
-        if self.daq_connectboard(0): #load configuration file
+        if self.daqgroups:
+            connected = self.daq_connectgroups(self.daqgroups, self.daqsyncbit) #one group of channels per board
+        else:
+            connected = self.daq_connectboard(0)
+        if connected: #load configuration file
             try:
                 self.daqstatus_LED.setPixmap(QtGui.QPixmap(":/icons/icons/Green_btn.png"))
                 self.connect_daq_pushButton.setText('Disconnect')
@@ -495,9 +559,19 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
                 self.scanrange2_lineEdit.setText('220')
                 self.offset2_lineEdit.setText('0')
                 self.TTLfreq_comboBox.setCurrentIndex(5)
+                #live progress in the status bar, published from a DAQ thread
+                self.daq_subscribe(self.daqstatus_signals.status.emit)
+                self.daq_start_status(10)
+                if self.tracer is not None:
+                    self.tracer.attach(self)
+                #start signals on external TTL for sync with other instruments
+                self.daq_update_triggermode({"external": 1, "retrigger": 2}.get(self.daqtrigger, 0))
+                #signals generated in earlier sessions load from disk
+                self.daq_update_store(self.daqstore, self.daqstoremb)
                 #push the DAQ signal
                 self.continuousscan_option = True 
                 self.pushnewdaqsignal(True)
+                self.precompiledaqsignals() #selecting other VPS/FPS combinations then only copies a buffer
             except: #if could not load all parameters from configuration file
                 self.connect_daq_pushButton.setText('Disconnect')
                 self.connectvsdisconnectdaq()
@@ -536,7 +610,7 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
         if loadnewdaqsignalflag:
             FPS = int(self.TTLfreq_comboBox.currentText())
             VPS = float(self.VPS_comboBox.currentText())
-            if (FPS/VPS).is_integer():
+            if (FPS/VPS).is_integer() and self.camprofile.sweep_rate(FPS) > 0:
                 pass
             else:
                 self.msg += '\U000026A0 Incompatible VPS FPS combination! Resetting values to default ...'
@@ -551,41 +625,25 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
                 updatedaq_worker = Worker(lambda: self._pushdaqsignalnow(loadnewdaqsignalflag))
                 updatedaq_worker.signals.finished.connect(self._donewithdaqupdate)        
                 updatedaq_worker.signals.error.connect(lambda: self.errorindaqupdate(updatedaq_worker.errormsg))    
+                self.daqthreadcount_update(+1) #counted from now on, so that waiting threads do not miss a queued worker
                 self.threadpool.start(updatedaq_worker)
         except Exception as e: 
             print(e)
             traceback.print_exc()
         
     def _pushdaqsignalnow(self, loadnewdaqsignalflag):
-        self.daqthread_count += 1  
         if loadnewdaqsignalflag:      
-            V1_range = int(self.scanrange1_lineEdit.text())*self.g1vpd*self.g1dpµm  #*G1_µm2mechRot*G1_mechRot2v
-            V1_offset = int(self.offset1_lineEdit.text())*self.g1vpd*self.g1dpµm  #*G1_µm2mechRot*G1_mechRot2v
-            V2_range = int(self.scanrange2_lineEdit.text())*self.g2vpd*self.g2dpµm  #*G2_µm2mechRot*G2_mechRot2v
-            V2_offset = int(self.offset2_lineEdit.text())*self.g2vpd*self.g2dpµm  #*G2_µm2mechRot*G2_mechRot2v
-            VPS = float(self.VPS_comboBox.currentText())
-            FPS = int(self.TTLfreq_comboBox.currentText())
-            V4 = float(1.5*(int(self.laser_comboBox.currentIndex())))
-
-            # number of pixels along camera width (longer dim / X-axis), ensure even
-            if self.widthpx % 2 == 0:
-                points_per_ramp = int(self.widthpx/6) # div by 6 because pencil beam lateral FWHM covers more than 12 pixels at once
+            self.daq_load_signals(*self.daqsignalargs())
+        #a looping signal patched in place (laser/trigger change) or swapped at a volume boundary is already live, no need to restart it
+        restartdaq = not (loadnewdaqsignalflag and self.daq_loadmode in ('patched', 'hotswapped') and self.continuousscan_option and self.daq_isrunning())
+        if restartdaq:
+            #ensure older thread(s) get(s) closed
+            self.daq_terminate_signal()
+            self.daqthreads_wait(1) #wait till only 1 thread (current one) is running
+            if self.daqsweeps:
+                self.daq_push_sweeps(self.daqsweeps)
             else:
-                points_per_ramp = int((self.widthpx-1)/6)
-            #if 2nd galvo is absent, no need to go super fine in sampling
-            if V2_range == 0:
-                points_per_ramp = 200
-
-            activetrigger_option = self.daq_trigenable_radioButton.isChecked()
-            self.daq_load_signals(V1_range,V1_offset,VPS,V2_range,V2_offset,FPS,V4, points_per_ramp, activetrigger_option)
-        #ensure older thread(s) get(s) closed
-        self.daq_terminate_signal()
-        while True:
-            time.sleep(0.1) #wait till only 1 thread (current one) is running
-            if self.daqthread_count == 1:
-                time.sleep(0.1) #additional wait to be safe - sufficient or add a bit more? 
-                break
-        self.daq_push_signals(self.continuousscan_option)
+                self.daq_push_signals(self.continuousscan_option)
         
         #Re-enable user interaction once DAQ is updated
         self.scanrange1_lineEdit.setEnabled(True)
@@ -598,19 +656,92 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
         if loadnewdaqsignalflag:
             self.daqhasupdatedsignal = True #inform that daq has updated        
         #make the thread wait till signal has finished running
-        self.daq_wait() 
+        if restartdaq:
+            self.daq_wait() 
 
     def _donewithdaqupdate(self):
-        self.daqthread_count -= 1
+        self.daqthreadcount_update(-1)
         # self.msg += 'Just terinated an old DAQ signal thread'
 
 
+    def updatedaqstatus(self, status):
+        """
+        Show progress of the running DAQ signal (crossbill.daq.DAQStatus) in the status bar
+        """
+        if status.running:
+            txt = f'DAQ: sweep {status.sweep+1}, plane {status.plane+1}, {status.triggers} trigger(s)'
+            if status.remaining is not None:
+                txt += f', {status.remaining:.1f} s remaining'
+            self.statusbar.showMessage(txt)
+        elif self.statusbar.currentMessage():
+            self.statusbar.clearMessage()
+
     def errorindaqupdate(self,errormsg):
         self.msg += '\U000026A0 Error in updating DAQ signal!\n'
         self.msg += errormsg
-        self.daqthread_count -= 1
+        #thread count is updated by _donewithdaqupdate, the worker emits finished after error too
+
+    def daqthreadcount_update(self, change):
+        """
+        Update the number of running DAQ threads and wake up threads waiting on it (see daqthreads_wait)
+        """
+        with self.daqthread_cv:
+            self.daqthread_count += change
+            self.daqthread_cv.notify_all()
+
+    def daqthreads_wait(self, count):
+        """
+        Block the calling thread till no more than count DAQ threads are running
+        """
+        with self.daqthread_cv:
+            self.daqthread_cv.wait_for(lambda: self.daqthread_count <= count)
 
 
+    def daqsignalargs(self, VPS=None, FPS=None):
+        """
+        Returns the arguments of daq_load_signals for the values in the UI
+
+        VPS: float, FPS: int
+            override the values selected in the UI if given
+        """
+        V1_range = int(self.scanrange1_lineEdit.text())*self.g1vpd*self.g1dpµm  #*G1_µm2mechRot*G1_mechRot2v
+        V1_offset = int(self.offset1_lineEdit.text())*self.g1vpd*self.g1dpµm  #*G1_µm2mechRot*G1_mechRot2v
+        V2_range = int(self.scanrange2_lineEdit.text())*self.g2vpd*self.g2dpµm  #*G2_µm2mechRot*G2_mechRot2v
+        V2_offset = int(self.offset2_lineEdit.text())*self.g2vpd*self.g2dpµm  #*G2_µm2mechRot*G2_mechRot2v
+        if VPS is None:
+            VPS = float(self.VPS_comboBox.currentText())
+        if FPS is None:
+            FPS = int(self.TTLfreq_comboBox.currentText())
+        V4 = float(1.5*(int(self.laser_comboBox.currentIndex())))
+
+        # DSLM sampling from the number of rows along the rolling shutter (camera width / X-axis),
+        # reduced to what the DAQ board and the camera allow by MCCdaq.daq_optimize_rate
+        points_per_ramp = self.camprofile.points_per_ramp()
+        #if 2nd galvo is absent, no need to go super fine in sampling
+        if V2_range == 0:
+            points_per_ramp = 200
+
+        activetrigger_option = self.daq_trigenable_radioButton.isChecked()
+        return V1_range, V1_offset, VPS, V2_range, V2_offset, FPS, V4, points_per_ramp, activetrigger_option, self.camprofile
+
+    def precompiledaqsignals(self):
+        """
+        Precompile the DAQ signals of the VPS/FPS combinations of the UI in the background (see MCCdaq.daq_precompile),
+        those closest to the current selection first. Laser and trigger changes are derived from these when selected.
+        """
+        try:
+            if not self.daqcfgmaths():
+                return
+            VPS_list = [float(self.VPS_comboBox.itemText(i)) for i in range(self.VPS_comboBox.count())]
+            FPS_list = [int(self.TTLfreq_comboBox.itemText(i)) for i in range(self.TTLfreq_comboBox.count())]
+            VPS_index = self.VPS_comboBox.currentIndex()
+            FPS_index = self.TTLfreq_comboBox.currentIndex()
+            order = sorted(((i, j) for i in range(len(VPS_list)) for j in range(len(FPS_list))),
+                key=lambda ij: abs(ij[0] - VPS_index) + abs(ij[1] - FPS_index))
+            self.daq_precompile([self.daqsignalargs(VPS_list[i], FPS_list[j]) for i, j in order])
+        except:
+            self.msg += '\U000026A0 Could not precompile DAQ signals\n'
+
     def daqcfgmaths(self):
         try:
             #Use CFG variables from the form entry
@@ -663,7 +794,11 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
         MCL_MicroDrive.__init__(self)
         MCL_MicroDrive.stage_connect(self)
         self.stagethread_count = 0 #to keep count of the stage threads
+        if self.tracer is not None:
+            self.tracer.attach(self) #stage DLL is new after MCL_MicroDrive.__init__
         if self.stage_handle > 0:
+            if self.stagesamplerate > 0:
+                self.stage_start_sampler(self.stagesamplerate) #actual stage positions over time, e.g. to register tiles
             self.stagestatus_LED.setPixmap(QtGui.QPixmap(":/icons/icons/Green_btn.png"))
             self.connect_stage_pushButton.setText('Disconnect')
             self.recenter_pushButton.setEnabled(True)
@@ -688,6 +823,22 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
             self.Yneg_pushButton.setEnabled(False)   
             QtWidgets.QMessageBox.about(self, "Error! No stage detected", "\nConnect stage to PC (USB), and power outlet before proceeding ...")    
 
+    def tracespan(self, name):
+        """
+        Returns a context manager recording the time spent in a block of code if tracing is on (CROSSBILL_TRACE)
+        """
+        if self.tracer is None:
+            return contextlib.ExitStack() #does nothing
+        return self.tracer.span(name, 'imaging')
+
+    def savetrace(self):
+        """
+        Save the Chrome trace of DAQ/stage calls (if tracing is on) and print the latency summary
+        """
+        if self.tracer is not None:
+            self.tracer.export_chrome_trace(self.tracefile)
+            print(self.tracer.report())
+
     def recenterstage(self):        
         stagerecenter_worker = Worker(self.recenternowstage)
         stagerecenter_worker.signals.error.connect(lambda: self.recentererrorstage(stagerecenter_worker.errormsg))
@@ -833,11 +984,14 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
             self.msg += '\U000026A0 Stage is already busy, try to move after previous move has finished!\n'
         
     def movecompletestage(self):
+        self.showpositionstage()
+        self.stagethread_count -= 1
+
+    def showpositionstage(self):
         self.unfreezemotionstage()
         self.stage_getcurrentposition() 
         positiontext = '('+ str(round(self.stage_YXposition[0],2)) + ',' + str(round(self.stage_YXposition[1],2)) + ') µm'
         self.location_display_label.setText(positiontext)
-        self.stagethread_count -= 1
 
     def freezemotionstage(self):
         self.recenter_pushButton.setEnabled(False)
@@ -995,9 +1149,18 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
             QtWidgets.QMessageBox.about(self, "Error! Invalid scan-time entered", "Invalid scan-time entry detected. Resetting to 10 ...")            
             self.scantime = 10 #default scan-time
             self.mode_fun_scantime_lineEdit.setText(str(self.scantime)) #update scan-time entry with default
-        total_frames = int(self.TTLfreq_comboBox.currentText())*self.scantime #calculate num frames        
+        if self.timedelay_radioButton.isChecked():
+            total_frames = int(self.TTLfreq_comboBox.currentText())*self.scantime #time-lapse: calculate num frames
+        else:
+            total_frames = self.functionalimagingsweeps()*int(int(self.TTLfreq_comboBox.currentText())/float(self.VPS_comboBox.currentText())) #calculate num frames        
         self.functionalcamframes_label.setText('#frames ' + str(total_frames)) #update displayed total num frames in UI 
 
+    def functionalimagingsweeps(self):
+        """
+        Number of whole sweeps (volumes) covering the functional scan-time. The DAQ pushes exactly this many.
+        """
+        return max(1, math.ceil(self.scantime*float(self.VPS_comboBox.currentText())))
+
     def startfunctionalimaging(self):        
         functionalimaging_worker = Worker(self.start_functionalimaging_thread)
         functionalimaging_worker.signals.finished.connect(self.finished_functionalimaging_thread)
@@ -1025,7 +1188,8 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
             self.msg += 'DAQ is all set for time-lapse imaging ....\n'            
         else:
             self.continuousscan_option = True #continuous looping enabled - used inside DAQ thread
-            self.msg += 'DAQ is all set for functional imaging ....\n'          
+            self.daqsweeps = self.functionalimagingsweeps() #DAQ thread pushes exactly this many sweeps
+            self.msg += f'DAQ is all set for functional imaging ({self.daqsweeps} sweeps) ....\n'          
                 
             
         # 2. Output DAQ signal WITH TRIGGER and wait till acquisition is finished
@@ -1047,10 +1211,7 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
                         self.pushnewdaqsignal(False)
                         print("2")
                     #wait till completion of sweep because self.continuousscan_option was set to false above (in step 1 for time-lapse)
-                    while True: 
-                        time.sleep(0.1)     
-                        if self.daqthread_count == 0:
-                            break            
+                    self.daqthreads_wait(0)
                     time.sleep(self.timedelay) #add time delay on top
                     self.msg += f"Done with {i+1} out of {int(self.num_sweeps)} sweeps in time-lapse \n"
                 else:
@@ -1067,11 +1228,10 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
             else:
                 #if trigger box is checked, just push a new signal
                 self.pushnewdaqsignal(False) #push new daq but no need to look for new signal 
-            t0 = time.time()
             self.msg += 'DAQ trigger signal is working with camera now .... \n'
-            #wait till scan time has elapsed
-            while (time.time()-t0) < (self.scantime):
-                time.sleep(0.1)         
+            #wait till all the sweeps are out (or Stop was pressed)
+            self.daqthreads_wait(0)
+            self.daqsweeps = None
         self.msg += 'Assigned time has elapsed. DAQ trigger is terminating now. \n'
         self.daq_terminate_signal()
         self.continuousscan_option = True # Fall back to the default continuous looping option - used inside DAQ thread
@@ -1079,6 +1239,7 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
     def stop_functionalimaging(self):
         self.mode_fun_StartStop_pushButton.setText('Start')
         self.mode_fun_StartStop_pushButton.setEnabled(False) #disable button push press till other threads stop
+        self.daq_stop_stream() #ends the sweeps pushed for functional imaging
         self.msg += '\U000026A0 Functional imaging was stopped abruptly!\n'       
         # self.mode_fun_StartStop_pushButton.setEnabled(True)
 
@@ -1091,6 +1252,7 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
         QtWidgets.QMessageBox.about(self, "Error! during functional imaging", "Could not execute the assigned functional imaging ...")
         self.msg += '\U000026A0 Error during functional imaging thread execution.\n'
         self.msg += errormsg
+        self.daqsweeps = None #back to single/continuous scans
         self.mode_fun_StartStop_pushButton.setText('Start')
         self.mode_fun_StartStop_pushButton.setEnabled(True)
 
@@ -1111,6 +1273,8 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
         self.Y_steps = int(self.Y_steps)
         if Y_rem > 0: self.Y_steps += 1 #overcompensate for the remainder
         # print(self.Y_steps)
+        if getattr(self, 'yneg_lim', None) is not None and getattr(self, 'ypos_lim', None) is not None:
+            self.Y_steps = min(self.Y_steps, scanplan.tiles_within(self.yneg_lim, self.ypos_lim, sopi_range)) #last tile within the stage limits
 
     def structuralXrange(self):
         """
@@ -1126,6 +1290,8 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
         self.X_steps = int(self.X_steps)
         if X_rem > 0: self.X_steps += 1
         # print(self.X_steps)
+        if getattr(self, 'xneg_lim', None) is not None and getattr(self, 'xpos_lim', None) is not None:
+            self.X_steps = min(self.X_steps, scanplan.tiles_within(self.xneg_lim, self.xpos_lim, self.SOPi_Xfov)) #last tile within the stage limits
 
     def startstructualimaging(self):
         structuralimaging_worker = Worker(self.start_structuralimaging_thread)
@@ -1156,40 +1322,18 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
         self.msg += 'Starting structural imaging thread now ...\n'
 
         # 2. Move stage to the starting position i.e. to self.yneg_lim,self.xneg_lim
-        # Move stage (along Y-axis) and wait till done
+        # All stage moves run back to back through the stage motion queue (waypoints in absolute µm)
         self.msg += 'Moving stage to the starting position ...\n'
-        if not self.stepenable_radioButton.isChecked():
-            self.stepenable_radioButton.setChecked(True) #ensure step move is enabled
+        self.velocitystage() #ensure self.stage_velocity is available
+        self.freezemotionstage()
         try:
-            _ = float(self.yneg_lim)  
-            if abs(self.yneg_lim-self.stage_YXposition[0]) >= 0.1:          
-                self.movestep_lineEdit.setText(str(self.yneg_lim-self.stage_YXposition[0]))  #update movestep size for +y-axis
-                self.Ypos_movestage() #y-move
-                self.msg += 'Moving stage along y-axis... \n'
-                while True: # wait till the end of stage motion
-                    time.sleep(0.1)
-                    # print(str(self.stagethread_count),end=', ')
-                    if self.stagethread_count == 0:
-                        break  
-            self.msg += 'Stage is at the starting position along y-axis ...\n'
-            # print(self.yneg_lim-self.stage_YXposition[0])
+            y_start = float(self.yneg_lim)
         except:
-            self.msg += "Stage was already at the starting position along y-axis.\n"
-
-        # Move stage (along X-axis) and wait till done
+            y_start = self.stage_YXposition[0] #stage was already at the starting position along y-axis
         try:
-            _ = float(self.xneg_lim)
-            if abs(self.xneg_lim-self.stage_YXposition[1]) >= 0.1:
-                self.movestep_lineEdit.setText(str(self.xneg_lim-self.stage_YXposition[1]))  #update movestep size for +x-axis                
-                self.Xpos_movestage() #x-move
-                self.msg += 'Moving stage along x-axis... \n'
-                while True: # wait till the end of stage motion
-                    time.sleep(0.1)
-                    if self.stagethread_count == 0:
-                        break
-            self.msg += 'Stage is at the starting position along x-axis ...\n'
+            x_start = float(self.xneg_lim)
         except:
-            self.msg += "Stage was already at the starting position along x-axis.\n"
+            x_start = self.stage_YXposition[1] #stage was already at the starting position along x-axis
 
         # 3. Ensure DAQ trigger o/p is enabled and o/p is set for once (non-looping)
         # Ensure DAQ o/p is silent by the end of this step as to not enable untimed camera frame acquisition
@@ -1204,83 +1348,132 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
 
         # 3. Update num frames and do the acquisition        
         # DAQ o/p is silent so camera will wait for trigger signal from DAQ
+        imaging_start = time.perf_counter() #stage trajectory is saved from here on
         self.structuralcamframes_label.setText(str(int((self.X_steps)*(self.Y_steps)*int(self.TTLfreq_comboBox.currentText())/float(self.VPS_comboBox.currentText())))) 
         sopi_range = int(self.scanrange1_lineEdit.text()) #to be used for stage Y motion step size
-        # Do loop action for X_steps and Y_steps 
-        self.msg += 'Starting a total of %d runs ... \n' %(self.X_steps*self.Y_steps)
-        i = 0 #count number of loop runs
-        for _ in range (self.X_steps):
-            for _ in range (self.Y_steps):
-                i += 1 #loop count increment
-                # filename = str(i)+str(j) #use this to write image filename 
-                if self.mode_struc_StartStop_pushButton.text() == 'Stop':
-                    # Push single loop with daq trigger and wait till done
-                    if not self.daq_trigenable_radioButton.isChecked():
-                        #if trigger box is unchecked, check it to generate DAQ signal
-                        self.daq_trigenable_radioButton.setChecked(True) #will generate toggle signal and new DAQ o/p with trigger                        
-                    else:
-                        #if trigger box is checked, just push a new signal
-                        self.pushnewdaqsignal(False) #no need to calculate/load a new signal - just push existing one
-                    #wait till DAQ signal runs once
-                    while True:                    
-                        time.sleep(0.1)
-                        if self.daqthread_count == 0:
-                            break
-                    self.msg += f'####### Finished step {i} out of {self.Y_steps*self.X_steps}. ({self.Y_steps},{self.X_steps}) #######\n'
-                    self.msg += f'####### Total# trigger(s): {i*int(int(self.TTLfreq_comboBox.currentText())/float(self.VPS_comboBox.currentText()))} #######\n'
-                    # Move stage (along Y-axis) and wait till done
-                    self.movestep_lineEdit.setText(str(sopi_range))  #update movestep size for +y-axis                
-                    self.Ypos_movestage() #forward y-move first    
-                    self.msg += 'Moving stage along y-axis... \n' 
-                    while True: # wait till the end of stage motion (end of motion makes the stage thread count 0)
-                        time.sleep(0.1)
-                        if self.stagethread_count == 0:
-                            break  
-            if self.mode_struc_StartStop_pushButton.text() == 'Stop':
-                #move BACK to starting y point and wait till done (provided stop button was not pressed)
-                self.movestep_lineEdit.setText(str(sopi_range*self.Y_steps))  #update movestep size for -y-axis
-                self.Yneg_movestage() #move along -y
-                self.msg += 'Moving stage along y-axis... \n'
-                while True: 
-                        time.sleep(0.1)
-                        if self.stagethread_count == 0:
-                            break
-                #move one step along x and wait till done
-                self.movestep_lineEdit.setText(str(self.SOPi_Xfov*1.0))  #update movestep size for +x-axis. SOPi % of FOV as per the camera sensor size
-                self.Xpos_movestage()
-                self.msg += 'Moving stage along x-axis... \n'
-                while True: 
-                        time.sleep(0.1)
-                        if self.stagethread_count == 0:
-                            break
-        #compensate for X-moves performed in above loop
-        if self.mode_struc_StartStop_pushButton.text() == 'Stop':
-            self.movestep_lineEdit.setText(str(self.SOPi_Xfov*1.0*self.X_steps))  #update movestep size for -x-axis. SOPi FOV as per the camera sensor size
-            self.Xneg_movestage()
-            self.msg += 'Moving stage along x-axis... \n'
-            while True:
-                    time.sleep(0.1)
-                    if not self.stagethread_count > 0:
-                        break            
+        self.structuralplanes = int(int(self.TTLfreq_comboBox.currentText())/float(self.VPS_comboBox.currentText())) #triggers per tile
+        # Tiles: Y_steps along y (SOPi scan range apart) by X_steps along x (SOPi X FOV apart as per the camera sensor size)
+        # in the order of the scan-path planner (serpentine by default: no return travel between columns)
+        self.structuraltiles = scanplan.plan(self.scanorder, y_start, x_start, sopi_range, self.SOPi_Xfov, self.Y_steps, self.X_steps)
+        self.structuraltilelog = []
+        waypoints = [Waypoint(tile.y, tile.x, self.stage_velocity, False) for tile in self.structuraltiles]
+        waypoints.append(Waypoint(y_start, x_start, self.stage_velocity, False)) #back to the starting position, no tile
+        motion_time = scanplan.motion_time(self.structuraltiles, self.stage_velocity, tuple(self.stage_YXposition), (y_start, x_start))
+        self.msg += 'Imaging Y %d µm (%d tiles) by X %d µm (%d tiles)\n' %(self.Y_steps*sopi_range, self.Y_steps, self.X_steps*self.SOPi_Xfov, self.X_steps)
+        if self.Y_steps*sopi_range < self.Yrange or self.X_steps*self.SOPi_Xfov < self.Xrange:
+            self.msg += '\U000026A0 Y/X range entered (%d/%d µm) reduced to the stage limits\n' %(self.Yrange, self.Xrange)
+        self.msg += 'Starting a total of %d runs (%s order, ~%.1f s of stage motion) ... \n' %(self.X_steps*self.Y_steps, self.scanorder, motion_time)
+        self.stage_queue_moves(waypoints, self.structuraltile)
+        self.stage_wait_moves() #till the end of the last move
         # Stop recording        
         # Enable continuous loop for DAQ and end
         self.continuousscan_option = True
+        self.savestructuraltiles()
+        self.savestagetrajectory(imaging_start)
+
+    def savestructuraltiles(self):
+        """
+        Save the imaged tiles of structural imaging (acquisition index, row and column in the mosaic, planned and
+        reached stage position, time.perf_counter time) to the camera save folder, to put the images in place when stitching
+        """
+        if not self.structuraltilelog or not self.filesaveloc_lineEdit.text():
+            return
+        self.changefilenameprefix()
+        filename = os.path.join(self.filesaveloc_lineEdit.text(), self.FileNamePrefix + 'tiles.csv')
+        try:
+            with open(filename, 'w') as file:
+                file.write('index,row,column,y_um,x_um,stage_y_um,stage_x_um,time_s\n')
+                for tile, position, reached in self.structuraltilelog:
+                    file.write(f'{tile.index},{tile.row},{tile.column},{tile.y:.3f},{tile.x:.3f},{position[0]:.3f},{position[1]:.3f},{reached:.6f}\n')
+            self.msg += f'Tile positions saved to {filename}\n'
+        except:
+            self.msg += '\U000026A0 Could not save the tile positions\n'
+
+    def savestagetrajectory(self, since):
+        """
+        Save the sampled stage positions (if sampling is on, see stage_start_sampler) since a time.perf_counter time
+        to the camera save folder, for registering tiles against the actual stage positions
+        """
+        if getattr(self, 'stage_sampler_thread', None) is None or not self.filesaveloc_lineEdit.text():
+            return
+        self.changefilenameprefix()
+        filename = os.path.join(self.filesaveloc_lineEdit.text(), self.FileNamePrefix + 'stage_trajectory.csv')
+        try:
+            self.stage_export_trajectory(filename, since)
+            self.msg += f'Stage trajectory saved to {filename}\n'
+        except:
+            self.msg += '\U000026A0 Could not save the stage trajectory\n'
         # loadnewdaqsignalflag = False
         # self.pushnewdaqsignal(loadnewdaqsignalflag)
 
+    def structuraltile(self, index, position):
+        """
+        Image one tile of structural imaging: called by the stage motion queue (in its driver thread) once the stage has
+        reached the tile. The DAQ sweep gets started in the GUI thread (startstructuraltile), this waits till it is done.
+
+        index: int
+            tile number (from 0, acquisition order of self.structuraltiles), the last waypoint (back to the start) is not a tile
+        position: (y, x) stage position in µm
+        """
+        if index >= len(self.structuraltiles):
+            return
+        reached = time.perf_counter()
+        i = index + 1
+        # Push single loop with daq trigger (widgets and DAQ threads are handled in the GUI thread) and wait till done
+        with self.tracespan(f'tile {i} DAQ'):
+            self.structuraltile_started.clear()
+            self.stagetile_signals.tile.emit(index)
+            self.structuraltile_started.wait()
+            if not self.structuraltile_ok:
+                return #stopped
+            #wait till DAQ signal runs once
+            self.daqthreads_wait(0)
+        tile = self.structuraltiles[index]
+        self.structuraltilelog.append((tile, position, reached))
+        self.msg += f'####### Finished step {i} out of {self.Y_steps*self.X_steps}. Tile (row {tile.row}, column {tile.column}) of ({self.Y_steps},{self.X_steps}) at ({position[0]:.2f},{position[1]:.2f}) µm #######\n'
+        self.msg += f'####### Total# trigger(s): {i*self.structuralplanes} #######\n'
+
+    def startstructuraltile(self, index):
+        """
+        Start the DAQ sweep of a structural imaging tile (GUI thread, see StageTileSignals), unless imaging was stopped
+
+        index: int
+            tile number (from 0, acquisition order of self.structuraltiles)
+        """
+        try:
+            self.structuraltile_ok = self.mode_struc_StartStop_pushButton.text() == 'Stop'
+            if self.structuraltile_ok:
+                if not self.daq_trigenable_radioButton.isChecked():
+                    #if trigger box is unchecked, check it to generate DAQ signal
+                    self.daq_trigenable_radioButton.setChecked(True) #toggle signal starts (and counts) the DAQ thread with trigger right away
+                else:
+                    #if trigger box is checked, just push a new signal
+                    self.pushnewdaqsignal(False) #no need to calculate/load a new signal - just push existing one
+        except:
+            self.structuraltile_ok = False
+            self.msg += f'\U000026A0 Could not start the DAQ signal of tile {index + 1}\n'
+        finally:
+            self.structuraltile_started.set()
+
     def finished_structuralimaging_thread(self):
         self.msg += 'Done with structural imaging thread.\n'
+        self.showpositionstage() #unfreeze stage UI and show the position
         self.mode_struc_StartStop_pushButton.setText('Start')
 
     def error_structuralimaging_thread(self, errormsg):
         self.msg += '\U000026A0 Error in executing structural imaging thread.\n'
         self.msg += errormsg
+        if getattr(self, 'stage_handle', None): #stage connected
+            self.stage_cancel_moves()
+            self.showpositionstage()
         self.mode_struc_StartStop_pushButton.setText('Start')
 
     def stop_structuralimaging(self):   
         self.mode_struc_StartStop_pushButton.setText('Start')   
         #stop DAQ signal is taken care of in the main structural imaging thread - it stops at end of single sweep
-        self.haltstage() #halt stage
+        if getattr(self, 'stage_handle', None): #stage connected
+            self.stage_cancel_moves() #drop the remaining tiles
+            self.haltstage() #halt stage
 
     def resetstagelimit(self):
         if self.Xpos_lim_pushButton.isChecked():
@@ -1336,7 +1529,10 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
             txt += ' VPS ('
             if self.imaging_mode_comboBox.currentIndex() == 1:
                 #functional imaging 
-                self.num_sweeps = self.scantime*float(self.VPS_comboBox.currentText())
+                if self.timedelay_radioButton.isChecked():
+                    self.num_sweeps = self.scantime*float(self.VPS_comboBox.currentText()) #time-lapse runs int(self.num_sweeps) single sweeps
+                else:
+                    self.num_sweeps = self.functionalimagingsweeps() #exact number of sweeps pushed by the DAQ
                 txt += str(self.num_sweeps)
             else:
                 #structural imaging has no scan-time.
@@ -1353,7 +1549,10 @@ class myWindow(QtWidgets.QMainWindow, Ui_MainWindow, MCCdaq, MCL_MicroDrive):
 
             #keep updating total frames in UI in imaging mode
             if self.imaging_mode_comboBox.currentIndex() == 1:            
-                total_frames = int(self.TTLfreq_comboBox.currentText())*self.scantime
+                if self.timedelay_radioButton.isChecked():
+                    total_frames = int(self.TTLfreq_comboBox.currentText())*self.scantime
+                else:
+                    total_frames = self.num_sweeps*num_planes
                 self.functionalcamframes_label.setText('#frames ' + str(total_frames))
             elif self.imaging_mode_comboBox.currentIndex() == 2:
                 self.structuralYrange() #get Yrange
@@ -1423,4 +1622,6 @@ if __name__ == "__main__":
     app.setStyleSheet(qdarkstyle.load_stylesheet_pyqt5())
     w = myWindow()
     w.show()
-    sys.exit(app.exec_())
+    exitcode = app.exec_()
+    w.savetrace()
+    sys.exit(exitcode)
@@ -0,0 +1,112 @@
+"""
+Camera rolling shutter profiles.
+
+The DSLM galvo (G2) sweeps the pencil beam along the rolling shutter, so the sweep rate, the number of points per ramp
+and hence the DAQ rate follow from the camera readout timing instead of a fixed 80 Hz.
+
+MIT License
+
+Copyright (c) 2021 Manish Kumar
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import math
+
+G2_FLYBACK_FRACTION = 0.04 #fraction of a DSLM sweep spent in the down-ramp (opposite rolling shutter direction)
+
+class CameraProfile:
+    """
+    Rolling shutter readout timing of a camera.
+
+    name: str
+    line_time: float
+        time taken by the rolling shutter to advance by one row, in seconds
+    rows: int
+        number of rows read out along the rolling shutter direction (camera width for crossbill-mini)
+    readout_direction: str
+        'forward' or 'reverse'. A reverse readout swaps the direction of the G2 up- and down-ramps
+
+    The default profile is the Prime95B (10 µs per row, 1200 rows): the 96% up-ramp takes 12 ms, i.e. 80 Hz sweeps.
+    """
+    def __init__(self, name='Prime95B', line_time=10e-6, rows=1200, readout_direction='forward'):
+        if readout_direction not in ('forward', 'reverse'):
+            raise ValueError("readout_direction must be 'forward' or 'reverse'")
+        if line_time <= 0 or rows <= 0:
+            raise ValueError('line_time and rows must be positive')
+        self.name = name
+        self.line_time = float(line_time)
+        self.rows = int(rows)
+        self.readout_direction = readout_direction
+
+    def __repr__(self):
+        return f"CameraProfile('{self.name}', line_time={self.line_time}, rows={self.rows}, readout_direction='{self.readout_direction}')"
+
+    @property
+    def readout_time(self):
+        """
+        Time taken by the rolling shutter to cross all rows, in seconds
+        """
+        return self.line_time*self.rows
+
+    @property
+    def reverse_readout(self):
+        return self.readout_direction == 'reverse'
+
+    @property
+    def max_sweep_rate(self):
+        """
+        Fastest DSLM sweep rate (Hz) at which the up-ramp still keeps pace with the rolling shutter
+        """
+        return (1 - G2_FLYBACK_FRACTION)/self.readout_time
+
+    def sweep_rate(self, FPS):
+        """
+        DSLM sweep rate (Hz) to use at a given camera frame rate.
+        Each exposure has to hold a whole number of sweeps, so this is the largest multiple of FPS not exceeding max_sweep_rate.
+        Returns 0 if FPS itself is faster than the camera allows.
+
+        FPS: int
+        """
+        return int(math.floor(self.max_sweep_rate/FPS + 1e-9))*FPS #small tolerance guards against float round-off (e.g. 79.99999)
+
+    def points_per_ramp(self):
+        """
+        Number of DAQ points in one DSLM sweep (up + down ramp) for the rows of this camera (even number of rows assumed)
+        div by 6 because pencil beam lateral FWHM covers more than 12 pixels at once
+        """
+        return int((self.rows - self.rows % 2)/6)
+
+    @classmethod
+    def from_cfg(cls, cfg_dict):
+        """
+        Build a profile from a CFG dictionary (see crossbill-mini json files).
+        Keys are optional so that older CFG files load as a Prime95B:
+        "camera": name, "line_time_us": line time in µs, "width_pixels": rows, "readout_direction": 'forward'/'reverse'
+        """
+        default = cls()
+        return cls(name=cfg_dict.get("camera", default.name),
+                   line_time=float(cfg_dict.get("line_time_us", default.line_time*1e6))*1e-6,
+                   rows=int(cfg_dict.get("width_pixels", default.rows)),
+                   readout_direction=cfg_dict.get("readout_direction", default.readout_direction))
+
+    def to_cfg(self):
+        """
+        CFG dictionary entries of this profile (rows are saved as width_pixels by the GUI)
+        """
+        return {"camera": self.name, "line_time_us": round(self.line_time*1e6, 6), "readout_direction": self.readout_direction}
@@ -29,15 +29,367 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
-from mcculw import ul
-from mcculw.ul import ULError
-from mcculw.enums import BoardInfo, InfoType, InterfaceType, ULRange, ErrorCode, ScanOptions, FunctionType, Status 
+from mcculw.enums import BoardInfo, InfoType, InterfaceType, ULRange, ErrorCode, ScanOptions, FunctionType, Status, EventType, TrigType, DigitalPortType, DigitalIODirection 
 from time import sleep 
 import emoji
 # import matplotlib.pyplot as plt 
 
 import numpy as np
-import ctypes, time, pathlib, os
+import ctypes, time, pathlib, os, sys, collections, threading, traceback, concurrent.futures, hashlib, warnings
+#UL backend: the MCC Universal Library, or the simulated board (crossbill.daqsim) only if asked for with CROSSBILL_DAQ=sim
+#or where the UL can not exist (mcculw.ul needs the Windows cbw DLL). On Windows, a broken UL install raises here
+#instead of running on a simulated board that outputs no signal.
+if os.environ.get('CROSSBILL_DAQ') == 'sim':
+    from crossbill import daqsim as ul
+    from crossbill.daqsim import ULError
+else:
+    try:
+        from mcculw import ul
+        from mcculw.ul import ULError
+    except Exception:
+        if sys.platform == 'win32':
+            raise
+        warnings.warn('MCC Universal Library not available on this platform: crossbill.daq runs on the SIMULATED board '
+            '(crossbill.daqsim), no signal gets output. Set CROSSBILL_DAQ=sim to select it explicitly.', RuntimeWarning)
+        from crossbill import daqsim as ul
+        from crossbill.daqsim import ULError
+try:
+    from multiprocessing import shared_memory #python 3.8+, only needed for precompilation (see MCCdaq.daq_precompile)
+except ImportError:
+    shared_memory = None
+from crossbill import waveform as waveform_module, camera as camera_module
+from crossbill.waveform import WaveformParams, build_waveform, select_channels, patch_laser, patch_trigger, expand_to_shared_memory, CodeStream
+from crossbill.camera import CameraProfile
+
+def use_backend(backend):
+    """
+    Function to switch the UL implementation used by MCCdaq, e.g. to the simulated board for hardware-free runs and benchmarks.
+    Takes effect for boards connected afterwards.
+
+    backend: module
+        mcculw.ul or crossbill.daqsim
+    """
+    global ul, ULError
+    ul = backend
+    ULError = backend.ULError
+
+#AO scan throughput of known boards in S/s: max rate of each channel and max combined rate of all scanned channels
+BoardCapability = collections.namedtuple('BoardCapability', ['max_rate_per_channel', 'max_rate_aggregate'])
+BOARD_CAPABILITIES = {
+    'USB-3101FS': BoardCapability(100000, 400000), #4 channels updated simultaneously at 100 kS/s each
+}
+DEFAULT_BOARD_CAPABILITY = BoardCapability(10000, 40000) #conservative limits for boards missing from the table
+DAQ_RATE_MARGIN = 0.96 #stay a bit below the rated throughput (96 kS/s per channel for USB-3101FS)
+
+#channels of the signal output by one board in multi-board mode (see MCCdaq.daq_connectgroups)
+#channels: signal channels (Ch0 to Ch3 of crossbill.waveform.build_waveform) in the order of the AO channels of the board
+#e.g. galvos on board 0 and camera trigger/laser on board 1: [ChannelGroup(0, (0, 1)), ChannelGroup(1, (2, 3))]
+ChannelGroup = collections.namedtuple('ChannelGroup', ['board_num', 'channels'])
+
+#progress of the running AO signal, published by MCCdaq.daq_start_status
+#sweep, plane: current sweep (volume) and image plane within it, counted from 0
+#triggers: camera trigger pulses output so far. remaining: estimated time left in s (None for a looping signal)
+DAQStatus = collections.namedtuple('DAQStatus', ['running', 'sweep', 'plane', 'triggers', 'remaining', 'cur_count', 'cur_index'])
+
+class WaveformCache:
+    """
+    A least recently used (LRU) cache of ready-to-push DAC code buffers.
+    Buffers are keyed on the full set of parameters used to generate them (see MCCdaq.daq_load_signals).
+    Once the total size of the stored buffers exceeds max_bytes, the least recently used buffers get evicted.
+    Safe to share between threads (e.g. the precompilation thread of MCCdaq.daq_precompile). Stored buffers must not be modified.
+
+    max_bytes: int
+        memory cap for all cached buffers together (in bytes)
+    """
+    def __init__(self, max_bytes=256*1024**2):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """
+        Returns (codes, daq_rate) stored for the key or None. A hit marks the entry as most recently used.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def find(self, match):
+        """
+        Returns (key, (codes, daq_rate)) of the most recently used entry for which match(key) is True, or None.
+        Does not change the order of the entries.
+        """
+        with self._lock:
+            for key in reversed(self._entries):
+                if match(key):
+                    return key, self._entries[key]
+        return None
+
+    def put(self, key, codes, daq_rate):
+        """
+        Store a DAC code buffer (numpy uint16 array) along with the DAQ rate it has to be pushed at.
+        Buffers larger than the memory cap are not stored.
+        """
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[0].nbytes
+            if codes.nbytes > self.max_bytes:
+                return
+            self._entries[key] = (codes, daq_rate)
+            self.nbytes += codes.nbytes
+            self._evict()
+
+    def resize(self, max_bytes):
+        """
+        Update the memory cap, evicting buffers if needed.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and self._entries:
+            _, (codes, _) = self._entries.popitem(last=False)
+            self.nbytes -= codes.nbytes
+
+def _waveform_code_version():
+    """
+    Digest of the signal generation code: crossbill.waveform and crossbill.camera (G2 flyback, sweep rate and readout
+    direction of the camera profile). Part of the file names of WaveformStore, so that signals stored by another
+    version of the code are never loaded.
+    """
+    digest = hashlib.sha256()
+    try:
+        for module in (waveform_module, camera_module):
+            digest.update(pathlib.Path(module.__file__).read_bytes())
+    except OSError:
+        return 'unknown'
+    return digest.hexdigest()[:16]
+
+class WaveformStore:
+    """
+    A persistent on-disk store of DAC code buffers (one .npy file per signal), so that signals survive restarts and crashes.
+    Files are named by a digest of the signal parameters (keys of WaveformCache) and of the signal generation code,
+    followed by the DAQ rate. Stored signals are memory-mapped on load.
+    Once the total size of the files exceeds max_bytes, the least recently used files (by modification time) get deleted.
+
+    directory: str or pathlib.Path
+        folder of the store, created if needed
+    max_bytes: int
+        disk space for all stored signals together (in bytes)
+    """
+    def __init__(self, directory, max_bytes=2*1024**3):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.version = _waveform_code_version()
+        self._lock = threading.Lock()
+        for partial in self.directory.glob('*.tmp'): #left over by a crash while writing
+            self._remove(partial)
+
+    def __len__(self):
+        return len(self._files())
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def get(self, key):
+        """
+        Returns (codes, daq_rate) stored for the key or None. codes: read-only numpy memmap of the file.
+        A hit marks the file as most recently used.
+        """
+        path = self._find(key)
+        if path is None:
+            return None
+        try:
+            codes = np.load(path, mmap_mode='r')
+            daq_rate = int(path.stem.split('_')[1])
+            os.utime(path)
+        except (OSError, ValueError): #damaged file
+            self._remove(path)
+            return None
+        return codes, daq_rate
+
+    def put(self, key, codes, daq_rate):
+        """
+        Write a DAC code buffer (numpy uint16 array) along with the DAQ rate it has to be pushed at.
+        The file only appears once completely written. Returns True if stored.
+        """
+        path = self.directory / f'{self._digest(key)}_{int(daq_rate)}.npy'
+        partial = path.with_suffix('.tmp')
+        with self._lock:
+            try:
+                with open(partial, 'wb') as file:
+                    np.save(file, codes)
+                os.replace(partial, path)
+            except OSError:
+                self._remove(partial)
+                return False
+            self._evict()
+        return True
+
+    def resize(self, max_bytes):
+        """
+        Update the disk space limit, deleting files if needed.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            for path, _ in self._files():
+                self._remove(path)
+
+    def _digest(self, key):
+        return hashlib.sha256(f'{self.version} {tuple(key)!r}'.encode()).hexdigest()[:32]
+
+    def _find(self, key):
+        return next(self.directory.glob(self._digest(key) + '_*.npy'), None)
+
+    def _files(self):
+        """
+        Returns [(path, os.stat_result)] of the stored signals, least recently used first
+        """
+        files = []
+        for path in self.directory.glob('*.npy'):
+            try:
+                files.append((path, path.stat()))
+            except OSError: #deleted meanwhile
+                pass
+        return sorted(files, key=lambda file: file[1].st_mtime)
+
+    def _evict(self):
+        files = self._files()
+        total = sum(stat.st_size for _, stat in files)
+        for path, stat in files:
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                total -= stat.st_size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            path.unlink()
+            return True
+        except OSError: #e.g. still memory-mapped on windows
+            return False
+
+class DAQBufferPool:
+    """
+    A pool of windows buffers (ul.win_buf_alloc) for DAQ output, keyed by size (number of points).
+    Released buffers are kept for the next signal of the same size instead of being freed,
+    which avoids allocator churn and fragmentation of pinned memory over long sessions.
+    Once the total size of all buffers (in use and idle) exceeds max_bytes, the least recently released idle buffers get freed.
+    A buffer released while the board may still be reading it (running=True) is held back, neither reused nor freed,
+    till settle() gets called once the scan has stopped.
+
+    max_bytes: int
+        budget for all DAQ buffers together (in bytes). Buffers in use are never freed, so a large signal may exceed it
+    """
+    def __init__(self, max_bytes=512*1024**2):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._idle = collections.OrderedDict() #memhandle: num_points, least recently released first
+        self._inuse = {} #memhandle: num_points
+        self._pending = {} #memhandle: num_points, released while still being output (see settle)
+        self._lock = threading.Lock() #stream buffers are released from the refill thread
+
+    def __len__(self):
+        return len(self._idle) + len(self._inuse) + len(self._pending)
+
+    def acquire(self, num_points):
+        """
+        Returns the memhandle of a buffer holding num_points DAC codes (uint16), reusing an idle one of the same size if available.
+        Returns 0 if the allocation failed.
+        """
+        with self._lock:
+            for memhandle, size in self._idle.items():
+                if size == num_points:
+                    del self._idle[memhandle]
+                    self._inuse[memhandle] = size
+                    return memhandle
+            self._evict(2*num_points)
+            memhandle = ul.win_buf_alloc(num_points)
+            if memhandle:
+                self._inuse[memhandle] = num_points
+                self.nbytes += 2*num_points
+            return memhandle
+
+    def size(self, memhandle):
+        """
+        Returns the number of points of a buffer in use
+        """
+        return self._inuse[memhandle]
+
+    def release(self, memhandle, running=False):
+        """
+        Return a buffer to the pool. It stays allocated for reuse until evicted or cleared.
+
+        running: bool
+            True if a scan may still be reading the buffer: it only becomes reusable (or freed) after settle()
+        """
+        with self._lock:
+            size = self._inuse.pop(memhandle, None)
+            if size is None:
+                return
+            if running:
+                self._pending[memhandle] = size
+            else:
+                self._idle[memhandle] = size
+                self._evict()
+
+    def settle(self):
+        """
+        Make the buffers released while running reusable (freeing them if over budget). Call once the scan has stopped.
+        """
+        with self._lock:
+            if self._pending:
+                self._idle.update(self._pending)
+                self._pending.clear()
+                self._evict()
+
+    def resize(self, max_bytes):
+        """
+        Update the memory budget, freeing idle buffers if needed.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """
+        Free all idle buffers (and those released while running: the scan must have stopped)
+        """
+        with self._lock:
+            self._idle.update(self._pending)
+            self._pending.clear()
+            while self._idle:
+                self._free_oldest()
+
+    def _free_oldest(self):
+        memhandle, size = self._idle.popitem(last=False)
+        ul.win_buf_free(memhandle)
+        self.nbytes -= 2*size
+
+    def _evict(self, extra_bytes=0):
+        while self.nbytes + extra_bytes > self.max_bytes and self._idle:
+            self._free_oldest()
 
 class MCCdaq:
     """
@@ -45,14 +397,54 @@ class MCCdaq:
 
     Consists of following functions/methods:
     daq_connectboard: connect to DAQ device
+    daq_connectgroups: connect several boards as one DAQ device, each board outputting a group of channels
     daq_update_scanoption: update scan option to single or continuous
+    daq_update_triggermode: start AO signals by software, on an external TTL edge or once per sweep (retrigger)
     daq_update_signals: push fresh signal to DAQ board
+    daq_update_cachelimit: update memory cap of the waveform cache
+    daq_update_poollimit: update memory budget of the DAQ buffer pool
+    daq_update_store: set up the on-disk waveform store keeping signals across restarts
+    daq_update_boardlimits: look up AO throughput of the connected board in BOARD_CAPABILITIES
+    daq_optimize_rate: pick DAQ rate and points per DSLM ramp within the board limit
+    daq_signal_key: parameters (cache key) of the signal daq_load_signals would load
+    daq_precompile/daq_stop_precompile: fill the waveform cache in a background process pool
+    daq_patch_laser: rewrite laser signal (Ch3) of the loaded signal in place
+    daq_patch_trigger: rewrite camera trigger signal (Ch2) of the loaded signal in place
+    daq_swap_buffer: switch a looping signal to new codes at a volume boundary
+    daq_stream_signals: play an arbitrarily long stream of signals through a small circular buffer
+    daq_stop_stream: stop a running stream
+    daq_push_sweeps: push an exact number of sweeps (volumes) of the loaded signal
+    daq_subscribe/daq_unsubscribe: register callbacks for progress of the running signal (DAQStatus)
+    daq_start_status/daq_stop_status: start/stop the status publisher thread
+    daq_wait: wait for the end of the running signal (event driven, see daq_done)
     daq_deinit_device: De-initialize DAQ device
     """    
     def __init__(self):
         """
         Default initialization function for MCC DAQ board
         """        
+        self.daq_cache = WaveformCache() #ready-to-push DAC codes of recently used signals
+        self.daq_pool = DAQBufferPool() #windows buffers kept for reuse across reloads
+        self.daq_store = None #WaveformStore of generated signals on disk, see daq_update_store
+        self.daq_looping = False #True while a continuous scan is pushed (see daq_swap_buffer)
+        self.daq_stream_thread = None #refill thread of daq_stream_signals
+        self.daq_done = threading.Event() #set whenever no AO signal is running (end of scan, terminate or stream end)
+        self.daq_done.set()
+        self.daq_event_callback = None #UL end of scan callback, None if the board does not support it
+        self.daq_watcher = None #fallback watcher thread for boards without UL events
+        self.daq_watch_request = threading.Event()
+        self.daq_total_points = None #points of the pushed signal (all channels), None if looping
+        self.daq_subscribers = [] #callbacks of the status publisher
+        self.daq_status_thread = None
+        self.daq_trigger_mode = 0 #0: software start, 1: external trigger, 2: external retrigger (see daq_update_triggermode)
+        self.daq_trigger_options = 0 #extra scan options of the trigger mode
+        self.daq_groups = None #list of ChannelGroup in multi-board mode (see daq_connectgroups), None for a single board
+        self.daq_group_buffers = [] #(memhandle, codes) of the loaded signal of each group
+        self.daq_sync_bit = 0 #digital bit of the master board starting all boards
+        self.daq_precompile_thread = None #background thread of daq_precompile
+        self.daq_precompile_stop = threading.Event() #stop flag of the latest precompilation, each run gets its own
+        self.daq_board_name = 'USB-3101FS' #reference board of crossbill, updated by daq_connectboard
+        self.daq_max_rate = int(DAQ_RATE_MARGIN*BOARD_CAPABILITIES[self.daq_board_name].max_rate_per_channel)
         ul.ignore_instacal() #ignore pre-exisitng instacal record of identified devices
         self.dev_list = ul.get_daq_device_inventory(InterfaceType.USB) #get identified USB DAQ devices inventory         
         if len(self.dev_list) > 0:
@@ -88,6 +480,8 @@ class MCCdaq:
                 self.low_chan = 0
                 self.high_chan = int(ul.get_config(InfoType.BOARDINFO, self.board_num, 0, BoardInfo.NUMDACHANS))-1
                 self.msg += f"Board# {self.board_num} initialized\n"
+                self.daq_update_boardlimits(device.product_name)
+                self.daq_enable_endevent()
                 self.daq_update_scanoption(1) #scan continuously by default 
                 return True
             except:
@@ -98,6 +492,66 @@ class MCCdaq:
             return False
         
 
+    def daq_connectgroups(self, groups, sync_bit=0):
+        """
+        Function to initialize several boards as one DAQ device (multi-board mode). Each board outputs a group of
+        channels of the signal, so more channels and/or higher rates per channel fit than on a single board.
+        Signals are loaded as usual (daq_load_signals) and split per board, all boards are then armed and started together
+        by a shared trigger: wire digital bit sync_bit of the first (master) board to the TRIG input of every board, master included.
+        With an external trigger (see daq_update_triggermode) the external TTL goes to all TRIG inputs instead.
+        Looping signals are not hot swapped (daq_swap_buffer) in multi-board mode, they get restarted.
+
+        groups: list of ChannelGroup
+            each signal channel (Ch0 to Ch3) in exactly one group, one group per board. The board of the first group is the master
+        sync_bit: int
+            digital output bit (AUXPORT) of the master board used as start trigger
+
+        Returns True if all boards got initialized
+        """
+        groups = [ChannelGroup(int(board_num), tuple(channels)) for board_num, channels in groups]
+        if len(groups) < 2 or sorted(c for group in groups for c in group.channels) != [0, 1, 2, 3] \
+                or len(set(group.board_num for group in groups)) != len(groups):
+            self.msg += "\U000026A0 Error: channel groups must assign each signal channel (0 to 3) to exactly one of 2 or more boards.\n"
+            return False
+        if not self.daq_connectboard(groups[0].board_num):
+            return False
+        self.daq_groups = groups
+        self.daq_sync_bit = sync_bit
+        max_rates = []
+        try:
+            for group in groups:
+                if group.board_num >= self.max_board_num:
+                    raise ValueError(f"Board# {group.board_num} not found")
+                device = self.dev_list[group.board_num]
+                if group.board_num != self.board_num:
+                    ul.create_daq_device(group.board_num, device)
+                    self.msg += f"Board# {group.board_num} initialized\n"
+                if int(ul.get_config(InfoType.BOARDINFO, group.board_num, 0, BoardInfo.NUMDACHANS)) < len(group.channels):
+                    raise ValueError(f"Board# {group.board_num} has less than {len(group.channels)} AO channels")
+                self.daq_update_boardlimits(device.product_name, len(group.channels))
+                max_rates.append(self.daq_max_rate)
+            self.daq_max_rate = min(max_rates) #all boards run at the same rate
+            ul.d_config_port(self.board_num, DigitalPortType.AUXPORT, DigitalIODirection.OUT)
+            ul.d_bit_out(self.board_num, DigitalPortType.AUXPORT, self.daq_sync_bit, 0)
+            self.daq_update_triggermode(self.daq_trigger_mode) #all boards start on their TRIG input
+        except Exception as e:
+            self.msg += f"\U000026A0 Error in multi-board setup: {e}\n"
+            self.daq_disconnect()
+            return False
+        self.low_chan = 0
+        self.high_chan = 3 #channels of the whole signal
+        self.msg += f"Multi-board DAQ: {', '.join(f'board# {g.board_num} Ch{list(g.channels)}' for g in groups)}, " \
+            f"started by bit {sync_bit} of board# {self.board_num}. Max DAQ rate: {self.daq_max_rate} points/s per channel\n"
+        return True
+
+    def _daq_boardnums(self):
+        """
+        Returns the board numbers in use, master first
+        """
+        if self.daq_groups:
+            return [group.board_num for group in self.daq_groups]
+        return [self.board_num]
+
     def daq_update_scanoption(self, option):
         """
         Function to update the scan option of DAQ board
@@ -115,127 +569,606 @@ class MCCdaq:
         else:
             self.msg += "\U000026A0 Error updating scan option. Retry!\n"
 
+    def daq_update_triggermode(self, mode, rising_edge=True):
+        """
+        Function to select how AO signals start. With an external trigger the scan is armed by daq_push_signals
+        (or daq_push_sweeps) and starts on a TTL edge at the TRIG input of the board, without software start latency.
+        In multi-board mode (daq_connectgroups) boards are always armed, software start pulses the sync bit of the master board.
 
-    def daq_load_signals(self, V1_range, V1_offset, VPS, V2_range, V2_offset, FPS, V4, points_per_ramp, activetrigger_option):
+        mode: int
+            0: software start, the scan starts when pushed
+            1: external trigger, the scan starts on the first trigger edge
+            2: external retrigger, each trigger edge outputs one sweep (volume) of the signal,
+               so an external master clock paces the volumes
+        rising_edge: bool
+            True: start on rising edge of trigger signal
+            False: start on falling edge of trigger signal
+        """
+        try:
+            if mode == 0:
+                if self.daq_groups:
+                    for board_num in self._daq_boardnums():
+                        ul.set_trigger(board_num, TrigType.TRIG_POS_EDGE, 0, 0) #rising edge of the sync bit
+                self.daq_trigger_options = 0
+                self.msg += 'DAQ signals start by software\n'
+            elif mode in (1, 2):
+                trig_type = TrigType.TRIG_POS_EDGE if rising_edge else TrigType.TRIG_NEG_EDGE
+                for board_num in self._daq_boardnums():
+                    ul.set_trigger(board_num, trig_type, 0, 0) #thresholds are ignored for a digital trigger
+                self.daq_trigger_options = ScanOptions.EXTTRIGGER
+                if mode == 2:
+                    self.daq_trigger_options |= ScanOptions.RETRIGMODE
+                    self.msg += f'DAQ signals output one sweep per external trigger ({"rising" if rising_edge else "falling"} edge)\n'
+                else:
+                    self.msg += f'DAQ signals start on external trigger ({"rising" if rising_edge else "falling"} edge)\n'
+            else:
+                self.msg += "\U000026A0 Error updating trigger mode. Retry!\n"
+                return False
+            self.daq_trigger_mode = mode
+            return True
+        except ULError as e:
+            self.daq_trigger_mode = 0
+            self.daq_trigger_options = 0
+            self.msg += "\U000026A0 External trigger not supported by the DAQ board, signals start by software. Code: " + str(e.errorcode) + " Message: " + e.message + "\n"
+            return False
+
+    def _daq_scan_options(self, scan_options, sweep_points, group=None):
+        """
+        Returns scan_options with the options of the trigger mode added (see daq_update_triggermode).
+        In retrigger mode the number of points output per trigger is set to sweep_points (all channels).
+        Without sweep_points (a plain stream) the scan is only started by the first trigger.
+        group: ChannelGroup of the board in multi-board mode, always armed on its TRIG input
+        """
+        scan_options |= self.daq_trigger_options
+        if self.daq_trigger_mode == 2 and sweep_points is None:
+            scan_options &= ~ScanOptions.RETRIGMODE #no sweeps to retrigger, start once
+        elif self.daq_trigger_mode == 2:
+            board_num, num_channels = self.board_num, self.high_chan - self.low_chan + 1
+            if group is not None:
+                board_num, sweep_points = group.board_num, sweep_points//num_channels*len(group.channels)
+            ul.set_config(InfoType.BOARDINFO, board_num, 0, BoardInfo.DACTRIGCOUNT, int(sweep_points))
+        if group is not None:
+            scan_options |= ScanOptions.EXTTRIGGER
+        elif self.daq_trigger_mode:
+            self.msg += 'DAQ signal armed, waiting for external trigger ...\n'
+        return scan_options
+
+    def _daq_start_groups(self, scan_options, memhandles, daq_rate, sweep_points):
+        """
+        Arms the scan of every board in multi-board mode, master last, and starts them all at once:
+        with a pulse on the sync bit of the master board, or on the external trigger (see daq_update_triggermode).
+
+        memhandles: list of windows buffers, one per group (self.daq_groups)
+        """
+        for group, memhandle in reversed(list(zip(self.daq_groups, memhandles))):
+            ul.a_out_scan(group.board_num, 0, len(group.channels) - 1, self.daq_pool.size(memhandle), daq_rate,
+                ULRange.BIP10VOLTS, memhandle, self._daq_scan_options(scan_options, sweep_points, group))
+        if self.daq_trigger_mode:
+            self.msg += 'DAQ boards armed, waiting for external trigger ...\n'
+        else:
+            ul.d_bit_out(self.board_num, DigitalPortType.AUXPORT, self.daq_sync_bit, 1) #rising edge starts all boards
+            ul.d_bit_out(self.board_num, DigitalPortType.AUXPORT, self.daq_sync_bit, 0)
+
+    def daq_enable_endevent(self):
+        """
+        Function to get notified at the end of each AO scan (sets self.daq_done).
+        Uses the UL ON_END_OF_AO_SCAN event. Boards without event support get a single watcher thread instead.
+        """
+        try:
+            self.daq_event_callback = ul.ULEventCallback(self._daq_on_endevent) #keep a reference, UL calls it from its own thread
+            ul.enable_event(self.board_num, EventType.ON_END_OF_AO_SCAN, 0, self.daq_event_callback, None)
+            self.msg += 'DAQ end of scan is event driven\n'
+        except:
+            self.daq_event_callback = None
+            self.daq_watcher = threading.Thread(target=self._daq_watch, daemon=True)
+            self.daq_watcher.start()
+            self.msg += 'DAQ end of scan events not supported, watching scan status instead\n'
+
+    def _daq_on_endevent(self, board_num, event_type, event_data, user_data):
+        """
+        UL event callback for the end of an AO scan
+        """
+        self.daq_done.set()
+
+    def _daq_watch(self):
+        """
+        Watcher thread used instead of UL events: polls the scan status every ms after a single scan was pushed.
+        Runs until daq_disconnect.
+        """
+        while self.daq_watcher is threading.current_thread():
+            if not self.daq_watch_request.wait(0.5):
+                continue
+            self.daq_watch_request.clear()
+            while self.daq_isrunning():
+                sleep(0.001)
+            self.daq_done.set()
+
+    def daq_update_boardlimits(self, product_name, num_channels=None):
+        """
+        Function to set the highest AO rate per channel (self.daq_max_rate) for the connected board
+
+        product_name: str
+            as reported by the device descriptor, e.g. 'USB-3101FS'. Boards missing from BOARD_CAPABILITIES get DEFAULT_BOARD_CAPABILITY
+        num_channels: int or None
+            number of channels scanned on the board. None: all channels of the board
+        """
+        capability = BOARD_CAPABILITIES.get(product_name)
+        if capability is None:
+            capability = DEFAULT_BOARD_CAPABILITY
+            self.msg += f"\U000026A0 No AO throughput on record for {product_name}. Using conservative limits, add the board to BOARD_CAPABILITIES for full speed.\n"
+        if num_channels is None:
+            num_channels = self.high_chan - self.low_chan + 1 #all channels are scanned together
+        self.daq_board_name = product_name
+        self.daq_max_rate = int(DAQ_RATE_MARGIN*min(capability.max_rate_per_channel, capability.max_rate_aggregate/num_channels))
+        self.msg += f"Max DAQ rate: {self.daq_max_rate} points/s per channel ({num_channels} channels)\n"
+
+    def daq_optimize_rate(self, points_per_ramp, sweep_rate, camera=None, quiet=False):
+        """
+        Function to pick the number of points per DSLM ramp (and hence the DAQ rate) within the board limit
+
+        points_per_ramp: int or None
+            requested sampling of one DSLM sweep (e.g. CameraProfile.points_per_ramp). None: finest sampling available
+        sweep_rate: int
+            DSLM sweep rate in Hz
+        camera: crossbill.camera.CameraProfile or None
+            if given, a sweep is not sampled finer than one point per camera row (line time)
+        quiet: bool
+            True: no message when points_per_ramp gets reduced
+
+        Returns (points_per_ramp, daq_rate)
+        """
+        max_points = int(self.daq_max_rate/sweep_rate)
+        if camera is not None:
+            max_points = min(max_points, camera.rows)
+        if points_per_ramp is None:
+            points_per_ramp = max_points
+        elif points_per_ramp > max_points:
+            if not quiet:
+                limit = self.daq_board_name if camera is None else f'{self.daq_board_name}/{camera.name} ({camera.rows} rows)'
+                self.msg += f"\U000026A0 {points_per_ramp} points per DSLM ramp at {sweep_rate} Hz exceed the {limit} limit. Using {max_points} points.\n"
+            points_per_ramp = max_points
+        return points_per_ramp, points_per_ramp*sweep_rate
+
+    def daq_signal_key(self, V1_range, V1_offset, VPS, V2_range, V2_offset, FPS, V4, points_per_ramp, activetrigger_option, camera=None, quiet=False):
+        """
+        Function returning the parameters (WaveformParams, the key of self.daq_cache) of the signal daq_load_signals
+        would load for the same arguments. None if the combination cannot be output (FPS too fast for the camera
+        or not an integer multiple of VPS).
+
+        quiet: bool
+            True: no message when points_per_ramp gets reduced to fit the board and camera
+        """
+        if camera is None:
+            camera = CameraProfile()
+        sweep_rate = camera.sweep_rate(FPS)
+        if sweep_rate == 0 or not (FPS/VPS).is_integer():
+            return None
+        points_per_ramp, _ = self.daq_optimize_rate(points_per_ramp, sweep_rate, camera, quiet)
+        return WaveformParams(V1_range, V1_offset, VPS, V2_range, V2_offset, FPS, V4, points_per_ramp, activetrigger_option, sweep_rate, camera.reverse_readout, self.daq_max_rate)
+
+    def daq_precompile(self, combinations, max_bytes=None, max_workers=None):
+        """
+        Function to generate the signals of likely parameter combinations ahead of time, in a background process pool.
+        Each worker writes its DAC codes into a shared memory block (multiprocessing.shared_memory) that gets copied
+        into self.daq_cache, so that selecting one of these combinations later only copies a buffer (daq_loadmode 'cached').
+        Combinations that only differ from a cached signal in V4/activetrigger_option are derived from it when loaded,
+        so they need no precompilation of their own. Runs until done or daq_stop_precompile.
+
+        combinations: list of tuples
+            arguments of daq_load_signals (V1_range, V1_offset, VPS, V2_range, V2_offset, FPS, V4, points_per_ramp,
+            activetrigger_option, camera), most likely first. Invalid combinations are skipped.
+        max_bytes: int or None
+            total size of the precompiled signals (in bytes), half of the cache limit if None.
+            Combinations beyond it (in the order given) are skipped.
+        max_workers: int or None
+            number of worker processes, number of processors if None
+
+        Returns number of signals queued
+        """
+        if shared_memory is None:
+            self.msg += '\U000026A0 Signal precompilation needs python 3.8 or newer\n'
+            return 0
+        self.daq_stop_precompile()
+        if max_bytes is None:
+            max_bytes = self.daq_cache.max_bytes//2
+        tasks = [] #(key, num_points)
+        total = 0
+        for args in combinations:
+            key = self.daq_signal_key(*args, quiet=True)
+            if key is None or key in self.daq_cache or key in (task[0] for task in tasks) \
+                    or (self.daq_store is not None and key in self.daq_store): #stored signals load fast already
+                continue
+            num_points = build_waveform(*key).num_points #compact signal, cheap
+            if total + 2*num_points > max_bytes:
+                continue
+            total += 2*num_points
+            tasks.append((key, num_points))
+        if tasks:
+            self.daq_precompile_stop = threading.Event()
+            self.daq_precompile_thread = threading.Thread(target=self._daq_precompile, args=(tasks, max_workers, self.daq_precompile_stop), daemon=True)
+            self.daq_precompile_thread.start()
+            self.msg += f'Precompiling {len(tasks)} DAQ signal(s) ({total/1024**2:.1f} MB) in the background ......\n'
+        return len(tasks)
+
+    def _daq_precompile(self, tasks, max_workers, stop):
+        """
+        Precompilation thread: runs the workers, copies finished signals into the cache and frees their shared memory
+
+        stop: threading.Event
+            stop flag of this run
+        """
+        blocks = {}
+        done = 0
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+                for key, num_points in tasks:
+                    shm = shared_memory.SharedMemory(create=True, size=2*num_points)
+                    blocks[executor.submit(expand_to_shared_memory, key, shm.name)] = (key, num_points, shm)
+                for future in concurrent.futures.as_completed(blocks):
+                    key, num_points, shm = blocks[future]
+                    if stop.is_set():
+                        for pending in blocks:
+                            pending.cancel()
+                        break
+                    try:
+                        daq_rate = future.result()
+                        codes = np.ndarray(num_points, dtype=np.uint16, buffer=shm.buf).copy()
+                        self.daq_cache.put(key, codes, daq_rate)
+                        if self.daq_store is not None:
+                            self.daq_store.put(key, codes, daq_rate)
+                        done += 1
+                    except:
+                        self.msg += f'\U000026A0 Failed to precompile DAQ signal at {key.VPS} VPS, {key.FPS} FPS\n'
+        except:
+            self.msg += '\U000026A0 Error in DAQ signal precompilation\n'
+            traceback.print_exc()
+        finally:
+            for _, _, shm in blocks.values():
+                shm.close()
+                shm.unlink()
+        if not stop.is_set():
+            self.msg += f'Precompiled {done} DAQ signal(s) ({len(self.daq_cache)} signal(s) cached)\n'
+
+    def daq_stop_precompile(self, wait=False):
+        """
+        Function to stop a running precompilation (signals in progress are finished, queued ones dropped)
+
+        wait: bool
+            False: return right away, the precompilation thread winds down on its own (e.g. when called from the GUI thread).
+            True: wait till the signals in progress are finished and their shared memory freed (e.g. before disconnecting).
+        """
+        thread = self.daq_precompile_thread
+        if thread is not None:
+            self.daq_precompile_stop.set()
+            if wait:
+                thread.join()
+            self.daq_precompile_thread = None
+
+    def _daq_cache_variant(self, key):
+        """
+        Derive the signal of key from a cached signal that only differs in V4 and/or activetrigger_option:
+        its codes get copied and the laser/trigger channels patched (crossbill.waveform.patch_laser, patch_trigger),
+        which is much cheaper than generating the signal. Returns (codes, daq_rate), also stored in self.daq_cache, or None.
+        """
+        found = self.daq_cache.find(lambda cached: cached._replace(V4=key.V4, activetrigger_option=key.activetrigger_option) == key)
+        if found is None:
+            return None
+        variant, (codes, daq_rate) = found
+        codes = codes.copy()
+        if key.V4 != variant.V4:
+            patch_laser(codes, key.V4)
+        if key.activetrigger_option != variant.activetrigger_option:
+            patch_trigger(codes, int(daq_rate/key.FPS), key.activetrigger_option)
+        self.daq_cache.put(key, codes, daq_rate)
+        return codes, daq_rate
+
+    def daq_update_cachelimit(self, limit_mb):
+        """
+        Function to update the memory cap of the waveform cache (self.daq_cache)
+
+        limit_mb: float
+            value: 0 and higher (0 disables caching)
+            maximum memory (in MB) used for cached DAC code buffers
+        """
+        try:
+            self.daq_cache.resize(int(abs(float(limit_mb))*1024**2))
+            self.msg += f'Waveform cache limit set to {limit_mb} MB ({len(self.daq_cache)} signal(s) cached)\n'
+        except:
+            self.msg += "\U000026A0 Invalid entry for waveform cache limit. Retry!\n"
+
+    def daq_update_poollimit(self, limit_mb):
+        """
+        Function to update the memory budget of the DAQ buffer pool (self.daq_pool)
+
+        limit_mb: float
+            value: 0 and higher (0 frees buffers as soon as they are released)
+            maximum windows memory (in MB) kept for DAQ buffers
+        """
+        try:
+            self.daq_pool.resize(int(abs(float(limit_mb))*1024**2))
+            self.msg += f'DAQ buffer pool limit set to {limit_mb} MB ({len(self.daq_pool)} buffer(s), {self.daq_pool.nbytes/1024**2:.1f} MB)\n'
+        except:
+            self.msg += "\U000026A0 Invalid entry for DAQ buffer pool limit. Retry!\n"
+
+    def daq_update_store(self, directory, limit_mb=2048):
+        """
+        Function to set up the on-disk waveform store (self.daq_store) keeping generated signals across restarts
+
+        directory: str, pathlib.Path or None
+            folder of the store, created if needed. None or '' disables the store
+        limit_mb: float
+            value: 0 and higher
+            maximum disk space (in MB) used by stored signals
+        """
+        try:
+            if directory:
+                self.daq_store = WaveformStore(directory, int(abs(float(limit_mb))*1024**2))
+                self.msg += f'Waveform store: {directory} ({len(self.daq_store)} signal(s) stored, limit {limit_mb} MB)\n'
+            else:
+                self.daq_store = None
+        except:
+            self.daq_store = None
+            self.msg += "\U000026A0 Could not open the waveform store. Signals will not be kept across restarts.\n"
+
+    def _daq_store_save(self, key, codes, daq_rate):
+        """
+        Write a newly generated signal to self.daq_store from a background thread, not to delay its output.
+        codes must not be modified afterwards (e.g. the copy kept in self.daq_cache).
+        """
+        if self.daq_store is not None:
+            threading.Thread(target=self.daq_store.put, args=(key, codes, daq_rate), daemon=True).start()
+
+    def daq_load_signals(self, V1_range, V1_offset, VPS, V2_range, V2_offset, FPS, V4, points_per_ramp, activetrigger_option, camera=None):
         """
         A function to load new signals to windows memory. 
         This memory can later be accessed my DAQ to push AO signals out.
-        Note: This function is adapted for Prime95B to match the rolling shutter rate (10 µs per width pixel, 83.333 Hz DSLM)
-
-        V1_range: float
-        V1_offset: float
-        VPS: float/int
-        V2_range: float
-        V2_offset: float
-        FPS: int (fixed at 80 Hz!)
-        V4: float
-        points_per_ramp: int     
-        activetrigger_option: bool
-
-        Ch0: V1_range, V1_offset and VPS define the signal going to G1 galvo for lateral sweep of light-sheet
-        Ch1: V2_range, V2_offset, camera sensor read speed and points_per_ramp define the signal going to G2 galso for DSLM style light-sheet creation        
-        Ch2: FPS and activetrigger_option define TTL signal for Camera frame-rate control
-        Ch3: V4 defines the voltage signal controlling laser selection and on/off duration
-        points_per_ramp dictates how many points make up single ramp signal for G2
+        camera: crossbill.camera.CameraProfile (Prime95B if None) sets the DSLM sweep rate and direction.
+        points_per_ramp gets reduced to fit the connected board (see daq_optimize_rate), None picks the finest sampling possible.
+        Signals for a previously used (or precompiled, see daq_precompile) set of parameters are copied from self.daq_cache
+        instead of being regenerated, as are cached signals differing only in V4 and/or activetrigger_option (patched copy).
+        Generated signals are also kept in self.daq_store (if set, see daq_update_store), from which they get memory-mapped
+        and copied straight into windows memory after a restart.
+        If only V4 and/or activetrigger_option changed, the loaded signal is patched in place instead.
+        A continuously looping signal of unchanged size and rate is swapped at a volume boundary instead (see daq_swap_buffer).
+        self.daq_loadmode reports which of these happened: 'patched', 'hotswapped', 'cached', 'stored' or 'generated'.
+        See crossbill.waveform.build_waveform for the description of parameters and channels.
         """
-        
+        self.daq_loadmode = None
+        if camera is None:
+            camera = CameraProfile()
+        sweep_rate = camera.sweep_rate(FPS)
+        if sweep_rate == 0:
+            self.msg += f'\U000026A0 Error: {FPS} FPS is too fast for {camera.name} (max {camera.max_sweep_rate:.1f} Hz DSLM sweep rate).\n'
+            return
         if (FPS/VPS).is_integer(): 
-            #limit V1 and V2 signals
-            V1_min = max(V1_offset - V1_range/2, -10)
-            V1_max = min(V1_offset + V1_range/2, +10)
-            V2_min = max(V2_offset - V2_range/2, -10)
-            V2_max = min(V2_offset + V2_range/2, +10)
-
-            self.daq_rate = points_per_ramp*80 #number of D/A point output per second per channel #80 Hz is the sweep rate for Prime95b 
-            #max allowed rate is 100KS/s per channel for USB-3101FS
-            if self.daq_rate > 96000:
-                self.daq_rate = 96000 
-                points_per_ramp = int(self.daq_rate/80) #galvo specific for DSLM
-            points_per_exposure = int(self.daq_rate/FPS) #Camera trigger specific for number of planes
-            num_imageplanes = round(FPS/VPS) # number of oblique image planes per sweep
-            points_down_ramp = int(points_per_ramp*0.04) # number of points in down-ramp (this is opposite rolling shutter direction)
-            points_up_ramp = points_per_ramp - points_down_ramp # number of points in up-ramp (this is along rolling shutter direction)
-            if VPS < 1:
-                time = round(1/VPS) #total time for D/A points to output                 
-                ramp = np.linspace(V1_max, V1_min, num_imageplanes, endpoint=True)
-                signal1 = np.empty([points_per_ramp*int(80/FPS)*num_imageplanes]) #start with an empty signal - must get polulated in next steps
-                for iter in range (num_imageplanes):
-                    upsignal = np.repeat(ramp[iter], points_up_ramp*int(80/FPS))
-                    if iter == (num_imageplanes-1):
-                        downsignal = np.linspace(ramp[iter], ramp[0], points_down_ramp*int(80/FPS), endpoint=True)                        
-                    else:                        
-                        downsignal = np.linspace(ramp[iter], ramp[iter+1], points_down_ramp*int(80/FPS), endpoint=True)
-                    signal1[iter*points_per_ramp*int(80/FPS):(iter+1)*points_per_ramp*int(80/FPS)] = np.hstack((upsignal,downsignal)) #Ch0: light-sheet lateral sweep (SOPi) galvo signal 
-                # signal1 = np.repeat(ramp, points_per_ramp*int(80/FPS)) #Ch0: light-sheet lateral sweep (SOPi) galvo signal 
-                upramp = np.linspace(V2_min,V2_max,points_up_ramp,endpoint=True)
-                downramp = np.linspace(V2_max,V2_min,points_down_ramp,endpoint=True)        
-                signal2 = np.tile( np.hstack(( upramp,downramp )), 80*time) #Ch1: DSLM galvo signal
-                if activetrigger_option:
-                    signal3 = np.tile( np.hstack(( np.zeros(1), 5.0*np.ones(int(points_per_exposure/2-1)),np.zeros(int(points_per_exposure/2)) )), FPS*time) #Ch2: Cam trigger active
-                    self.msg += 'DAQ trigger output is ACTIVE\n'
-                else:
-                    signal3 = np.tile(np.zeros(points_per_exposure), FPS*time) # zeros / no cam trigger
-                    self.msg += 'DAQ trigger output DEACTIVATED\n'
-                signal4 = V4*np.ones(self.daq_rate*time)
-                signal4[-1] = 0 #end with a zero voltage to signal off
-                del ramp
+            key = self.daq_signal_key(V1_range, V1_offset, VPS, V2_range, V2_offset, FPS, V4, points_per_ramp, activetrigger_option, camera)
+            loaded = getattr(self, 'daq_params', None)
+            if loaded is not None and getattr(self, 'daq_codes', None) is not None \
+                    and key._replace(V4=loaded.V4, activetrigger_option=loaded.activetrigger_option) == loaded:
+                #only laser and/or trigger settings changed - no need to regenerate other channels
+                if V4 != loaded.V4:
+                    self.daq_patch_laser(V4)
+                if activetrigger_option != loaded.activetrigger_option:
+                    self.daq_patch_trigger(activetrigger_option)
+                self.daq_loadmode = 'patched'
+                return
+            cached = self.daq_cache.get(key)
+            if cached is None:
+                cached = self._daq_cache_variant(key)
+            stored = None
+            if cached is None and self.daq_store is not None:
+                cached = stored = self.daq_store.get(key) #memory-mapped file
+            if cached is None:
+                waveform = build_waveform(*key) #compact signal, expanded straight into windows memory below
+                daq_rate = waveform.daq_rate
+                num_points = waveform.num_points
             else:
-                ramp = np.linspace(V1_min, V1_max, num_imageplanes, endpoint=True)
-                signal1 = np.empty([points_per_ramp*int(80/FPS)*num_imageplanes]) #start with an empty signal - must get polulated in next steps
-                for iter in range (num_imageplanes):
-                    upsignal = np.repeat(ramp[iter], points_up_ramp*int(80/FPS))
-                    if iter == (num_imageplanes-1):
-                        downsignal = np.linspace(ramp[iter], ramp[0], points_down_ramp*int(80/FPS), endpoint=True)                        
-                    else:                        
-                        downsignal = np.linspace(ramp[iter], ramp[iter+1], points_down_ramp*int(80/FPS), endpoint=True)
-                    signal1[iter*points_per_ramp*int(80/FPS):(iter+1)*points_per_ramp*int(80/FPS)] = np.hstack((upsignal,downsignal))
-                # signal1 = np.tile(np.repeat(ramp, points_per_ramp*int(80/FPS)), 1) #Ch0: G1 for light-sheet sweep
-                upramp = np.linspace(V2_min,V2_max,points_up_ramp,endpoint=True)
-                downramp = np.linspace(V2_max,V2_min,points_down_ramp,endpoint=True) 
-                signal2 = np.tile( np.hstack(( upramp,downramp )) , num_imageplanes*int(80/FPS))  #Ch1: G2 for DSLM
-                if activetrigger_option:
-                    signal3 = np.tile( np.hstack(( np.zeros(1), 5.0*np.ones(int(points_per_exposure/2-1)),np.zeros(int(points_per_exposure/2)) )), num_imageplanes) #Ch2: Cam trigger
-                    self.msg += 'DAQ trigger output is ACTIVE\n'
-                else:
-                    signal3 = np.tile(np.zeros(points_per_exposure), num_imageplanes)
-                    self.msg += 'DAQ trigger output DEACTIVATED\n'
-                signal4 = V4*np.ones(int(self.daq_rate/VPS))
-                signal4[-1] = 0 #end with a zero voltage to signal off
-                del ramp
-            # plt.plot(signal1)
-            # plt.show()
-            signals = np.zeros(4*len(signal1)) # 4 times to accomodate all signals 1 to 4 together
-            # merge 4 signals in alternate fashion: 1,2,3,4,  1,2,3,4, ... 
-            signals[::4] = signal1
-            signals[1::4] = signal2
-            signals[2::4] = signal3
-            signals[3::4] = signal4      
-            del signal1, signal2, signal3, signal4
-
-            # if older signal data exists, clean it
-            try:
-                if self.data_array:
-                    self.daq_free_memory()
-            except:
-                self.msg += 'This must be the 1st run of DAQ device in the current session ... otherwise something went wrong with DAQ memory ...\n'
+                codes, daq_rate = cached
+                num_points = len(codes)
+            self.msg += f'DSLM sweep rate: {sweep_rate} Hz ({camera.name}, {daq_rate} points/s per channel)\n'
+            if activetrigger_option:
+                self.msg += 'DAQ trigger output is ACTIVE\n'
+            else:
+                self.msg += 'DAQ trigger output DEACTIVATED\n'
+
+            if self.daq_looping and getattr(self, 'daq_codes', None) is not None and not self.daq_groups \
+                    and (num_points, daq_rate) == (self.num_points, self.daq_rate) and self.daq_isrunning():
+                #same buffer size and rate: prepare the new signal aside and swap it in while the old one keeps looping
+                if cached is None:
+                    codes = np.empty(num_points, dtype=np.uint16)
+                    waveform.expand_into(codes)
+                    del waveform
+                    self.daq_cache.put(key, codes, daq_rate)
+                    self._daq_store_save(key, codes, daq_rate)
+                self.daq_swap_buffer(codes)
+                if stored is not None:
+                    self.daq_cache.put(key, self.daq_codes.copy(), daq_rate)
+                self.daq_params = key
+                self.daq_loadmode = 'hotswapped'
+                self.msg += 'Switched the looping DAQ signal at the end of a volume ......\n'
+                return
+            self.daq_rate = daq_rate
+
+            if self.daq_stream_thread is not None:
+                self.daq_stop_stream() #a stream may still be reading the loaded signal (see daq_push_sweeps)
+            # if older signal data exists, release its buffer to the pool
+            # a buffer that is still being output is only released once the new one is in hand, so that it does not get overwritten
+            loaded = getattr(self, 'daq_codes', None) is not None
+            running = loaded and self.daq_isrunning()
+            if not running:
+                self.daq_pool.settle() #buffers of an earlier scan that has ended meanwhile
+            if loaded and not running:
+                self.daq_free_memory() #same size buffer is picked right back up below
 
             self.msg += '*****************************************************************************************\n'
-            self.msg += 'Calculating and populating a new DAQ signal to windows memory .... please be patient ....\n'
+            if cached is None:
+                self.msg += 'Calculating and populating a new DAQ signal to windows memory .... please be patient ....\n'
+            elif stored is not None:
+                self.msg += 'Populating a previously calculated DAQ signal (from disk) to windows memory ....\n'
+            else:
+                self.msg += 'Populating a previously calculated DAQ signal (from cache) to windows memory ....\n'
             self.msg += '*****************************************************************************************\n'
-            self.num_points = len(signals)
+            self.num_points = num_points
+            if self.daq_groups:
+                self._daq_load_groups(key, waveform if cached is None else codes, running)
+                if stored is not None and self.daq_loadmode == 'cached':
+                    self.daq_loadmode = 'stored'
+                return
 
-            self.memhandle = ul.win_buf_alloc(self.num_points) #windows buffer allocation 
-            self.data_array = ctypes.cast(self.memhandle, ctypes.POINTER(ctypes.c_ushort))
+            memhandle = self.daq_pool.acquire(self.num_points) #windows buffer allocation (or reuse)
+            if running:
+                self.daq_free_memory(running=True) #freed once the old scan is stopped (daq_terminate_signal)
+            self.memhandle = memhandle
             if not self.memhandle:
                 self.msg += "\U000026A0 Error: Failed to allocate memory for DAQ output.\n"
-            #Calculate and store the waveform
-            for i in range(0, self.num_points):
-                #We need bit value for voltage V. This is 32768 + V*3061.8 Or, 2^15*(1+V/Vmax) where Vmax = 10.7 volts
-                self.data_array[i] = np.int(np.around(32768 + signals[i] * 3061.8)) 
+                return
+            self.data_array = ctypes.cast(self.memhandle, ctypes.POINTER(ctypes.c_ushort))
+            #Calculate and store the waveform straight into a zero-copy numpy view of the windows buffer
+            self.daq_codes = np.ctypeslib.as_array(self.data_array, shape=(self.num_points,))
+            if cached is None:
+                waveform.expand_into(self.daq_codes)
+                del waveform
+                codes = self.daq_codes.copy()
+                self.daq_cache.put(key, codes, self.daq_rate)
+                self._daq_store_save(key, codes, self.daq_rate)
+                self.daq_loadmode = 'generated'
+            else:
+                self.daq_codes[:] = codes #straight from the file if stored
+                self.daq_loadmode = 'cached'
+                if stored is not None:
+                    self.daq_cache.put(key, self.daq_codes.copy(), self.daq_rate)
+                    self.daq_loadmode = 'stored'
+            self.daq_params = key
             self.msg += 'Done with loading signals in the system memory ...... \n'
         else:
             self.msg += '\U000026A0 Error: incompatible FPS & VPS combination. Ensure FPS is an integer multiple of VPS.\n'
 
+    def _daq_load_groups(self, key, signal, running):
+        """
+        daq_load_signals in multi-board mode: the signal of each board gets written into its own windows buffer in parallel,
+        straight from the compact waveform (or from cached codes). The whole signal is kept as self.daq_codes (plain numpy array)
+        for the cache, in place patches and streams.
+
+        signal: crossbill.waveform.Waveform or cached codes (numpy array)
+        running: bool
+            True if the loaded signal is still being output (its buffers are released once the new ones are in hand)
+        """
+        num_channels = self.high_chan - self.low_chan + 1
+        memhandles = [self.daq_pool.acquire(self.num_points//num_channels*len(group.channels)) for group in self.daq_groups]
+        if running:
+            self.daq_free_memory(running=True) #freed once the old scans are stopped (daq_terminate_signal)
+        if not all(memhandles):
+            for memhandle in memhandles:
+                self.daq_pool.release(memhandle)
+            self.msg += "\U000026A0 Error: Failed to allocate memory for DAQ output.\n"
+            return
+        buffers = [np.ctypeslib.as_array(ctypes.cast(memhandle, ctypes.POINTER(ctypes.c_ushort)), shape=(self.daq_pool.size(memhandle),))
+            for memhandle in memhandles]
+        self.daq_group_buffers = list(zip(memhandles, buffers))
+        self.memhandle = None
+        self.data_array = None
+        cached = isinstance(signal, np.ndarray)
+        codes = np.array(signal) if cached else np.empty(self.num_points, dtype=np.uint16)
+        with concurrent.futures.ThreadPoolExecutor(len(buffers) + 1) as executor:
+            if cached:
+                tasks = [executor.submit(select_channels, codes, num_channels, group.channels, buffer)
+                    for group, buffer in zip(self.daq_groups, buffers)]
+            else:
+                tasks = [executor.submit(signal.subset(group.channels).expand_into, buffer)
+                    for group, buffer in zip(self.daq_groups, buffers)]
+                tasks.append(executor.submit(signal.expand_into, codes))
+            for task in tasks:
+                task.result()
+        self.daq_codes = codes
+        if cached:
+            if key not in self.daq_cache: #read from self.daq_store
+                self.daq_cache.put(key, codes.copy(), self.daq_rate)
+            self.daq_loadmode = 'cached'
+        else:
+            codes = codes.copy()
+            self.daq_cache.put(key, codes, self.daq_rate)
+            self._daq_store_save(key, codes, self.daq_rate)
+            self.daq_loadmode = 'generated'
+        self.daq_params = key
+        self.msg += f'Done with loading signals in the system memory of {len(buffers)} boards ...... \n'
+
+    def _daq_update_groups(self, channel):
+        """
+        Copy a channel of self.daq_codes, updated in place, to the buffer of the board outputting it (multi-board mode)
+        """
+        num_channels = self.high_chan - self.low_chan + 1
+        for group, (_, buffer) in zip(self.daq_groups, self.daq_group_buffers):
+            if channel in group.channels:
+                buffer[group.channels.index(channel)::len(group.channels)] = self.daq_codes[channel::num_channels]
+
+    def daq_patch_laser(self, V4):
+        """
+        A function to rewrite the laser signal (Ch3) of the loaded signal in place.
+        Only every 4th point of the windows memory gets updated, other channels stay untouched.
+        A looping signal picks up the change without restarting the scan.
+
+        V4: float
+        """
+        patch_laser(self.daq_codes, V4)
+        if self.daq_groups:
+            self._daq_update_groups(3)
+        self.daq_params = self.daq_params._replace(V4=V4)
+        self.msg += f'Laser signal updated to {V4} V in place\n'
+
+    def daq_patch_trigger(self, activetrigger_option):
+        """
+        A function to rewrite the camera trigger signal (Ch2) of the loaded signal in place.
+        Only every 4th point of the windows memory gets updated, other channels stay untouched.
+        A looping signal picks up the change without restarting the scan.
+
+        activetrigger_option: bool
+        """
+        patch_trigger(self.daq_codes, int(self.daq_rate/self.daq_params.FPS), activetrigger_option)
+        if self.daq_groups:
+            self._daq_update_groups(2)
+        self.daq_params = self.daq_params._replace(activetrigger_option=activetrigger_option)
+        if activetrigger_option:
+            self.msg += 'DAQ trigger output is ACTIVE (updated in place)\n'
+        else:
+            self.msg += 'DAQ trigger output DEACTIVATED (updated in place)\n'
+
+    def daq_swap_buffer(self, codes):
+        """
+        A function to switch a looping signal over to new DAC codes at the end of the current pass through windows memory (volume boundary).
+        Points already sent out in the current pass are replaced right away, the remaining ones as soon as the output
+        wraps around to the start of the buffer. The board keeps running, so there is no dropout and each volume comes
+        entirely from either the old or the new signal.
+
+        codes: numpy array (uint16)
+            new signal of the same length as the loaded one (self.num_points)
+        """
+        rate = self.daq_rate*(self.high_chan - self.low_chan + 1) #buffer points output per second
+        guard = min(int(0.05*rate), self.num_points//2) #keep ~50 ms between the output position and the points being rewritten
+        status, _, index = ul.get_status(self.board_num, FunctionType.AOFUNCTION)
+        if status == Status.RUNNING and index + 1 < guard:
+            sleep((guard - index)/rate) #output just wrapped around, let it move away from the start of the buffer
+            status, _, index = ul.get_status(self.board_num, FunctionType.AOFUNCTION)
+        if status != Status.RUNNING or index < 0:
+            self.daq_codes[:] = codes
+            return
+        split = index + 1 #points up to cur_index are already out in this pass
+        self.daq_codes[:split] = codes[:split]
+        last = index
+        while status == Status.RUNNING:
+            sleep(0.001)
+            status, _, index = ul.get_status(self.board_num, FunctionType.AOFUNCTION)
+            if index < last: #wrapped around: old tail is out, new volume started
+                break
+            last = index
+        self.daq_codes[split:] = codes[split:]
+
+    def daq_isrunning(self):
+        """
+        Returns True if a background DAQ signal is being output.
+        """
+        status, _, _ = ul.get_status(self.board_num, FunctionType.AOFUNCTION)
+        return status == Status.RUNNING
+
     def daq_push_signals(self,continuousscan_option):
         """
         A function to push AO signals through DAQ board.
@@ -247,67 +1180,383 @@ class MCCdaq:
             False: execute once
         """
         # output new signals
+        self.daq_looping = continuousscan_option
+        self.daq_total_points = None if continuousscan_option else self.num_points
+        self.daq_done.clear()
         try:
             self.ul_range = ULRange.BIP10VOLTS #usually ignored
             self.msg += 'Pushed a new AO signal through DAQ board ...'
-            if continuousscan_option:
+            if self.daq_groups:
+                self.msg += 'looping continuously\n' if continuousscan_option else 'once\n'
+                scan_options = ScanOptions.BACKGROUND | ScanOptions.SIMULTANEOUS
+                if continuousscan_option:
+                    scan_options |= ScanOptions.CONTINUOUS
+                self._daq_start_groups(scan_options, [memhandle for memhandle, _ in self.daq_group_buffers], self.daq_rate, self.num_points)
+                if not continuousscan_option and self.daq_event_callback is None:
+                    self.daq_watch_request.set()
+            elif continuousscan_option:
                 self.msg += 'looping continuously\n'
-                ul.a_out_scan(self.board_num, self.low_chan, self.high_chan, self.num_points, self.daq_rate,
-                    self.ul_range, self.memhandle, ScanOptions.CONTINUOUS | ScanOptions.BACKGROUND | ScanOptions.SIMULTANEOUS) #remove simultaneous option?
+                ul.a_out_scan(self.board_num, self.low_chan, self.high_chan, self.num_points, self.daq_rate, self.ul_range, self.memhandle,
+                    self._daq_scan_options(ScanOptions.CONTINUOUS | ScanOptions.BACKGROUND | ScanOptions.SIMULTANEOUS, self.num_points)) #remove simultaneous option?
             else:
                 self.msg += 'once\n'
-                ul.a_out_scan(self.board_num, self.low_chan, self.high_chan, self.num_points, self.daq_rate,
-                    self.ul_range, self.memhandle, ScanOptions.BACKGROUND | ScanOptions.SIMULTANEOUS) #remove simultaneous option?
+                ul.a_out_scan(self.board_num, self.low_chan, self.high_chan, self.num_points, self.daq_rate, self.ul_range, self.memhandle,
+                    self._daq_scan_options(ScanOptions.BACKGROUND | ScanOptions.SIMULTANEOUS, self.num_points)) #remove simultaneous option?
+                if self.daq_event_callback is None:
+                    self.daq_watch_request.set()
         except ULError as e:                
+            self.daq_done.set()
             print("\U000026A0 A UL error occurred with MCC DAQ. Code: " + str(e.errorcode) + " Message: " + e.message) 
             self.msg += "\U000026A0 A UL error occurred with MCC DAQ. Code: " + str(e.errorcode) + " Message: " + e.message
 
-    def daq_free_memory(self):
+    def daq_stream_signals(self, chunks, daq_rate, buffer_points=None, sweep_points=None):
+        """
+        A function to stream AO signals of any length in constant memory.
+        A small windows buffer is played in a continuous loop while a background thread refills the half that was just played
+        with the next points from chunks. Refill timing comes from ul.get_status cur_index.
+        The scan stops on its own as soon as the stream has been played out (then all channels are set to 0 V), or with daq_stop_stream.
+        In multi-board mode (daq_connectgroups) each board plays its own circular buffer, refilled from the same stream.
+
+        chunks: iterable of numpy arrays (uint16)
+            interleaved DAC codes (Ch0, Ch1, ... for each point) of any length, e.g. crossbill.waveform.waveform_chunks
+        daq_rate: int
+            number of D/A point output per second per channel
+        buffer_points: int or None
+            size of the circular buffer (all channels). Default: 1 s of output
+        sweep_points: int or None
+            points (all channels) output per external trigger in retrigger mode (see daq_update_triggermode).
+            Default: the whole stream starts on the first trigger
+        """
+        self.daq_stop_stream()
+        self.daq_terminate_signal()
+        num_channels = self.high_chan - self.low_chan + 1
+        if buffer_points is None:
+            buffer_points = daq_rate*num_channels
+        half = max(int(buffer_points/(2*num_channels)), 1)*num_channels #whole frames of all channels in each half
+        groups = self.daq_groups or [ChannelGroup(self.board_num, tuple(range(num_channels)))]
+        memhandles = [self.daq_pool.acquire(2*half//num_channels*len(group.channels)) for group in groups]
+        if not all(memhandles):
+            for memhandle in memhandles:
+                self.daq_pool.release(memhandle)
+            self.msg += "\U000026A0 Error: Failed to allocate memory for DAQ stream.\n"
+            return False
+        buffers = [np.ctypeslib.as_array(ctypes.cast(memhandle, ctypes.POINTER(ctypes.c_ushort)), shape=(self.daq_pool.size(memhandle),))
+            for memhandle in memhandles]
+        if self.daq_groups:
+            codes = np.empty(2*half, dtype=np.uint16) #stream is read here and split into the buffers of the boards
+            targets = list(zip(groups, buffers))
+        else:
+            codes = buffers[0] #stream is read straight into the windows buffer
+            targets = []
+        stream = CodeStream(chunks)
+        last_half = None #half holding the end of the stream
+        self.daq_done.clear()
+        try:
+            for i in (0, 1):
+                if last_half is None and not stream.fill(codes[i*half:(i+1)*half]):
+                    last_half = i
+                elif last_half is not None:
+                    codes[i*half:(i+1)*half] = 32768
+                self._daq_split_half(codes, i, half, targets)
+            self.ul_range = ULRange.BIP10VOLTS #usually ignored
+            scan_options = ScanOptions.CONTINUOUS | ScanOptions.BACKGROUND | ScanOptions.SIMULTANEOUS
+            if self.daq_groups:
+                self._daq_start_groups(scan_options, memhandles, daq_rate, sweep_points)
+            else:
+                ul.a_out_scan(self.board_num, self.low_chan, self.high_chan, 2*half, daq_rate,
+                    self.ul_range, memhandles[0], self._daq_scan_options(scan_options, sweep_points))
+        except ULError as e:
+            self.msg += "\U000026A0 A UL error occurred with MCC DAQ. Code: " + str(e.errorcode) + " Message: " + e.message
+            self.daq_terminate_signal() #boards armed before the error
+            for memhandle in memhandles:
+                self.daq_pool.release(memhandle)
+            self.daq_done.set()
+            return False
+        except:
+            for memhandle in memhandles:
+                self.daq_pool.release(memhandle) #error in the signal source
+            self.daq_done.set()
+            raise
+        self.daq_looping = False #no hot swap for streams
+        self.daq_total_points = None
+        self.daq_stream_stop = threading.Event()
+        self.daq_stream_thread = threading.Thread(target=self._daq_refill_stream, daemon=True,
+            args=(stream, codes, half, last_half, half/(daq_rate*num_channels), memhandles, targets))
+        self.daq_stream_thread.start()
+        self.msg += f'Streaming AO signal through DAQ board ({2*half} points circular buffer) ...\n'
+        return True
+
+    def _daq_split_half(self, codes, i, half, targets):
+        """
+        Copy half i of the stream buffer into the circular buffer of each board (multi-board mode, no-op otherwise)
+
+        targets: list of (ChannelGroup, buffer)
+        """
+        num_channels = self.high_chan - self.low_chan + 1
+        for group, buffer in targets:
+            board_half = half//num_channels*len(group.channels)
+            select_channels(codes[i*half:(i+1)*half], num_channels, group.channels, buffer[i*board_half:(i+1)*board_half])
+
+    def _daq_refill_stream(self, stream, codes, half, last_half, half_time, memhandles, targets):
+        """
+        Refill thread of daq_stream_signals. Refills each half of the circular buffer as soon as the output moves on to the other half.
+        Once the stream has ended, the scan is stopped as soon as cur_count reaches its last point, not at the end of the 0 V padded half.
+        """
+        poll = min(max(half_time/10, 0.001), 0.05)
+        played = 0 #half that is output right now, refilled once the output moves to the other one
+        underruns = 0
+        num_channels = self.high_chan - self.low_chan + 1
+        master_channels = len(targets[0][0].channels) if targets else num_channels #cur_index is read from the master board
+        try:
+            while not self.daq_stream_stop.is_set():
+                sleep(poll)
+                status, count, index = ul.get_status(self.board_num, FunctionType.AOFUNCTION)
+                if status != Status.RUNNING:
+                    break
+                if stream.exhausted and count//master_channels*num_channels >= stream.points: #end of the stream is out
+                    break
+                index = index//master_channels*num_channels #position in the stream buffer
+                if index//half == played:
+                    continue
+                if played == last_half: #end of the stream is out
+                    break
+                if index % half > half//2:
+                    underruns += 1 #refill is late, the other half may run out before next refill
+                if last_half is None:
+                    if not stream.fill(codes[played*half:(played+1)*half]):
+                        last_half = played
+                else:
+                    codes[played*half:(played+1)*half] = 32768 #0 V after the end of the stream
+                self._daq_split_half(codes, played, half, targets)
+                played ^= 1
+        except:
+            self.msg += '\U000026A0 Error in DAQ stream source:\n' + traceback.format_exc()
+        finally:
+            self.daq_terminate_signal()
+            for memhandle in memhandles:
+                self.daq_pool.release(memhandle)
+            self.daq_done.set()
+        if underruns:
+            self.msg += f'\U000026A0 DAQ stream refill was late {underruns} time(s). Use a larger buffer.\n'
+        self.msg += 'DAQ stream ended\n'
+
+    def daq_stop_stream(self):
+        """
+        A function to stop a running stream (see daq_stream_signals) and wait for its refill thread to finish.
+        """
+        if self.daq_stream_thread is not None:
+            self.daq_stream_stop.set()
+            self.daq_stream_thread.join()
+            self.daq_stream_thread = None
+
+    def daq_push_sweeps(self, num_sweeps):
+        """
+        A function to push exactly num_sweeps sweeps (volumes) of the loaded signal, followed by 0 V on all channels.
+        One sweep is one pass through the signal in windows memory. The loaded signal is streamed (see daq_stream_signals),
+        so the camera gets exactly num_sweeps times the triggers of one volume and no trailing partial volume.
+        In-place updates of the loaded signal (daq_patch_laser, daq_patch_trigger) apply from the next sweep on.
+
+        num_sweeps: int
+        """
+        if getattr(self, 'daq_codes', None) is None:
+            self.msg += "\U000026A0 Error: no DAQ signal loaded to push.\n"
+            return False
+        num_sweeps = int(num_sweeps)
+        self.msg += f'Pushed a new AO signal through DAQ board ... {num_sweeps} sweep(s)\n'
+        if not self.daq_stream_signals(self._daq_sweeps(num_sweeps), self.daq_rate, sweep_points=self.num_points):
+            return False
+        self.daq_total_points = num_sweeps*self.num_points
+        return True
+
+    def _daq_sweeps(self, num_sweeps):
+        """
+        Stream source of daq_push_sweeps: the loaded signal, num_sweeps times (no copies)
+        """
+        for _ in range(num_sweeps):
+            yield self.daq_codes
+
+    def daq_subscribe(self, callback):
+        """
+        Register a function to be called with a DAQStatus at every sample of the status publisher (see daq_start_status).
+        Callbacks run in the publisher thread and should return quickly (e.g. emit a Qt signal).
+        """
+        if callback not in self.daq_subscribers:
+            self.daq_subscribers.append(callback)
+
+    def daq_unsubscribe(self, callback):
+        if callback in self.daq_subscribers:
+            self.daq_subscribers.remove(callback)
+
+    def daq_status(self):
+        """
+        Returns a DAQStatus of the running signal, derived from ul.get_status and the loaded signal.
+        """
+        status, cur_count, cur_index = ul.get_status(self.board_num, FunctionType.AOFUNCTION)
+        running = status == Status.RUNNING
+        params = getattr(self, 'daq_params', None)
+        num_points = getattr(self, 'num_points', 0)
+        if not num_points or params is None:
+            return DAQStatus(running, 0, 0, 0, None, cur_count, cur_index)
+        num_channels = self.high_chan - self.low_chan + 1
+        points_per_exposure = int(self.daq_rate/params.FPS)
+        if self.daq_groups:
+            cur_count = cur_count//len(self.daq_groups[0].channels)*num_channels #master board outputs part of the channels
+        count = cur_count
+        if self.daq_total_points is not None:
+            count = min(cur_count, self.daq_total_points) #0 V padding at the end of daq_push_sweeps does not count
+        frames = count//num_channels #points output on each channel
+        sweep, point = divmod(max(count - 1, 0), num_points) #position of the last point output
+        plane = point//num_channels//points_per_exposure
+        triggers = 0
+        if params.activetrigger_option and frames > 1:
+            triggers = (frames - 2)//points_per_exposure + 1 #rising edge at the 2nd point of each exposure
+        remaining = None
+        if self.daq_total_points is not None:
+            remaining = max(self.daq_total_points - cur_count, 0)/(self.daq_rate*num_channels) if running else 0.0
+        return DAQStatus(running, sweep, plane, triggers, remaining, cur_count, cur_index)
+
+    def daq_start_status(self, rate=10):
+        """
+        Start the status publisher: a thread sampling the scan status at the given rate and passing a DAQStatus
+        to each subscriber (see daq_subscribe). The GUI does not need to poll.
+
+        rate: float
+            samples per second
+        """
+        self.daq_stop_status()
+        self.daq_status_stop = threading.Event()
+        self.daq_status_thread = threading.Thread(target=self._daq_publish_status, args=(1/rate,), daemon=True)
+        self.daq_status_thread.start()
+
+    def daq_stop_status(self):
+        """
+        Stop the status publisher thread
+        """
+        if self.daq_status_thread is not None:
+            self.daq_status_stop.set()
+            self.daq_status_thread.join()
+            self.daq_status_thread = None
+
+    def _daq_publish_status(self, interval):
+        """
+        Status publisher thread, see daq_start_status
+        """
+        while not self.daq_status_stop.wait(interval):
+            try:
+                status = self.daq_status()
+            except:
+                continue #e.g. signal being reloaded
+            for callback in list(self.daq_subscribers):
+                try:
+                    callback(status)
+                except:
+                    self.msg += '\U000026A0 Error in DAQ status callback, removed:\n' + traceback.format_exc()
+                    self.daq_unsubscribe(callback)
+
+    def daq_free_memory(self, running=False):
         """
         A function to free up the system meory so a new signal can get loaded. 
-        It frees self.memhandle and self.data_array. Run it before any 2nd+ run of daq_load_signals function. 
+        It releases self.memhandle (and the buffers of all boards in multi-board mode) to the buffer pool (self.daq_pool) and drops self.data_array. 
+
+        running: bool
+            True if the signal is still being output: its buffers are only reused or freed after the scan stops (DAQBufferPool.settle)
         """
         try:
-            ul.win_buf_free(self.memhandle)
+            for memhandle, _ in self.daq_group_buffers:
+                self.daq_pool.release(memhandle, running)
+            self.daq_group_buffers = []
+            self.daq_pool.release(self.memhandle, running)
             self.data_array = None
-            self.msg += 'Freed up old system memory for DAQ device ....\n'
+            self.daq_codes = None
+            self.daq_params = None
+            self.msg += 'Released old system memory for DAQ device to the buffer pool ....\n'
         except:
             self.msg += '\U000026A0 Could not free old system memory for DAQ device ...\n'
 
 
         
-    def daq_wait(self):
+    def daq_wait(self, timeout=None):
         """
         A function to ensure that the DAQ runs till end of signal.
-        Useful to make a thread wait for completion. 
+        Useful to make a thread wait for completion. Wakes up as soon as self.daq_done is set (end of scan event).
+        The scan status is still checked every 0.5 s in case an event gets lost.
+
+        timeout: float or None
+            max wait in seconds, None: wait till end of signal
+
+        Returns True if the signal has ended
         """        
-        status = Status.RUNNING
-        while status == Status.RUNNING:               
-            sleep(0.05)
-            status, _, _ = ul.get_status(self.board_num, FunctionType.AOFUNCTION) 
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.daq_done.wait(0.5 if deadline is None else max(min(0.5, deadline - time.monotonic()), 0)):
+            if not self.daq_isrunning():
+                self.daq_done.set()
+            elif deadline is not None and time.monotonic() >= deadline:
+                return False
+        return True
     
     def daq_terminate_signal(self):
         """
         A function to terminate looping signal in DAQ board.
         """        
+        if self.daq_groups:
+            self._daq_terminate_groups()
+            return
         self.status, _, _ = ul.get_status(self.board_num, FunctionType.AOFUNCTION)
         if self.status == Status.RUNNING:
+            self.daq_looping = False
             try:
                 ul.stop_background(self.board_num,FunctionType.AOFUNCTION)
-                ul.a_out(self.board_num,channel=0,ul_range=ULRange.BIP10VOLTS, data_value=np.int(32768)) #set channel to zero
-                ul.a_out(self.board_num,channel=1,ul_range=ULRange.BIP10VOLTS, data_value=np.int(32768)) #set channel to zero
-                ul.a_out(self.board_num,channel=2,ul_range=ULRange.BIP10VOLTS, data_value=np.int(32768)) #set channel to zero
-                ul.a_out(self.board_num,channel=3,ul_range=ULRange.BIP10VOLTS, data_value=np.int(32768)) #set channel to zero
+                ul.a_out(self.board_num,channel=0,ul_range=ULRange.BIP10VOLTS, data_value=32768) #set channel to zero
+                ul.a_out(self.board_num,channel=1,ul_range=ULRange.BIP10VOLTS, data_value=32768) #set channel to zero
+                ul.a_out(self.board_num,channel=2,ul_range=ULRange.BIP10VOLTS, data_value=32768) #set channel to zero
+                ul.a_out(self.board_num,channel=3,ul_range=ULRange.BIP10VOLTS, data_value=32768) #set channel to zero
                 self.msg += 'Stopped old backgroung DAQ task\n'
+                self.daq_done.set()
+                self.daq_pool.settle() #old buffers are no longer read
             except:
                 self.msg+= '\U000026A0 Error in stopping old background DAQ task\n'
+        else:
+            self.daq_done.set()
+            self.daq_pool.settle()
+
+    def _daq_terminate_groups(self):
+        """
+        daq_terminate_signal in multi-board mode: stops every board that is running or armed
+        """
+        self.daq_looping = False
+        try:
+            for group in self.daq_groups:
+                status, _, _ = ul.get_status(group.board_num, FunctionType.AOFUNCTION)
+                if status == Status.RUNNING:
+                    ul.stop_background(group.board_num, FunctionType.AOFUNCTION)
+                    for channel in range(len(group.channels)):
+                        ul.a_out(group.board_num, channel=channel, ul_range=ULRange.BIP10VOLTS, data_value=32768) #set channel to zero
+                    self.msg += f'Stopped old backgroung DAQ task on board# {group.board_num}\n'
+            self.daq_pool.settle() #old buffers are no longer read
+        except:
+            self.msg += '\U000026A0 Error in stopping old background DAQ task\n'
+        self.daq_done.set()
 
     def daq_disconnect(self):
         """
         A function for DAQ de-initialization.
         """
         try:
+            self.daq_stop_precompile(wait=True)
+            self.daq_stop_stream()
+            self.daq_stop_status()
+            self.daq_watcher = None #ends the watcher thread
+            if self.daq_event_callback is not None:
+                ul.disable_event(self.board_num, EventType.ON_END_OF_AO_SCAN)
+            self.daq_terminate_signal() #no scan may read the buffers freed below
             self.daq_free_memory()
+            self.daq_pool.clear()
+            for board_num in self._daq_boardnums()[1:]:
+                try:
+                    ul.release_daq_device(board_num)
+                except ULError:
+                    pass #board of a group that failed to initialize
+            self.daq_groups = None
             ul.release_daq_device(self.board_num)
             del self.dev_list
             self.msg += 'DAQ device de-initialized.\n'
@@ -0,0 +1,404 @@
+"""
+Simulated MCC DAQ board.
+
+Reproduces the part of the mcculw.ul API used by crossbill.daq (device inventory, windows buffers, AO scans,
+scan status, triggers, end of scan events) on top of a real or virtual clock, so that MCCdaq, waveform generation,
+push latency and the imaging loops can be run, profiled and regression-tested without hardware.
+Scans progress at their rate against the clock, check the rate limits of the simulated board and stop on their own
+at the end of a single scan. No signal is output: the points played are only counted.
+
+crossbill.daq uses this module when the CROSSBILL_DAQ environment variable is set to 'sim', and otherwise only on
+platforms without the UL driver (not Windows), with a RuntimeWarning. On Windows a UL driver that fails to load is an
+error, never a silent switch to the simulated board. It can also be selected at run time:
+    from crossbill import daq, daqsim
+    daqsim.configure(clock=daqsim.VirtualClock())
+    daq.use_backend(daqsim)
+The enums (mcculw.enums) are shared with the real driver, so the mcculw package (pure Python, installs on any platform)
+is needed for simulated runs as well.
+
+MIT License
+
+Copyright (c) 2021 Manish Kumar
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from mcculw.enums import ErrorCode, Status, ScanOptions, BoardInfo, EventType
+import ctypes, time, threading, heapq, itertools
+
+class ULError(Exception):
+    """
+    Error raised by the simulated board, with the attributes of mcculw.ul.ULError
+    """
+    def __init__(self, errorcode, message=None):
+        super(ULError, self).__init__()
+        self.errorcode = errorcode
+        self.message = message if message is not None else f'{ErrorCode(errorcode).name} (simulated board)'
+
+    def __str__(self):
+        return "Error " + str(self.errorcode) + ": " + self.message
+
+ULEventCallback = ctypes.CFUNCTYPE(None, ctypes.c_int, ctypes.c_uint, ctypes.c_uint, ctypes.c_void_p)
+
+class RealClock:
+    """
+    Wall clock: simulated scans progress in real time
+    """
+    def now(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(max(seconds, 0))
+
+    def call_at(self, t, callback):
+        """
+        Run callback (from a timer thread) once the clock reaches t. Returns a handle with a cancel() method.
+        """
+        timer = threading.Timer(max(t - self.now(), 0), callback)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+class _Call:
+    def __init__(self, callback):
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class VirtualClock:
+    """
+    Clock that only moves when advanced (or slept on), so hours of acquisition can be simulated in no time
+    and runs are deterministic. Callbacks that fall due run in the thread advancing the clock.
+
+    start: float
+        initial time in seconds
+    """
+    def __init__(self, start=0.0):
+        self.t = start
+        self._lock = threading.RLock()
+        self._pending = [] #heap of (time, order, call)
+        self._order = itertools.count()
+
+    def now(self):
+        return self.t
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        """
+        Move the clock forward by seconds, running the callbacks falling due in time order
+        """
+        with self._lock:
+            target = self.t + max(seconds, 0)
+        while True:
+            with self._lock:
+                if not self._pending or self._pending[0][0] > target:
+                    self.t = max(self.t, target)
+                    return
+                t, _, call = heapq.heappop(self._pending)
+                self.t = max(self.t, t)
+            if not call.cancelled:
+                call.callback()
+
+    def call_at(self, t, callback):
+        """
+        Run callback once the clock reaches t. Returns a handle with a cancel() method.
+        """
+        call = _Call(callback)
+        with self._lock:
+            heapq.heappush(self._pending, (t, next(self._order), call))
+        return call
+
+class SimDevice:
+    """
+    Descriptor of a simulated USB DAQ device (stands in for mcculw.structs.DaqDeviceDescriptor)
+
+    product_name: str
+    unique_id: str
+        serial number
+    num_dac_chans: int
+        number of AO channels
+    max_rate_per_channel, max_rate_aggregate: int
+        highest AO scan rate in S/s of each channel and of all scanned channels together
+    start_latency: float
+        time spent in a_out_scan before the scan starts (s), e.g. USB round trips of the real board
+    """
+    def __init__(self, product_name='USB-3101FS', unique_id='00000001', num_dac_chans=4,
+            max_rate_per_channel=100000, max_rate_aggregate=400000, start_latency=0.0):
+        self.product_name = product_name
+        self.unique_id = unique_id
+        self.num_dac_chans = num_dac_chans
+        self.max_rate_per_channel = max_rate_per_channel
+        self.max_rate_aggregate = max_rate_aggregate
+        self.start_latency = start_latency
+
+    def __str__(self):
+        return f'{self.product_name} (simulated)'
+
+class _Scan:
+    """
+    AO scan in progress on a simulated board
+    """
+    def __init__(self, num_points, rate, options, trig_count):
+        self.num_points = num_points
+        self.rate = rate #points per second, all channels
+        self.continuous = bool(options & ScanOptions.CONTINUOUS)
+        self.segment = trig_count if options & ScanOptions.RETRIGMODE and trig_count > 0 else None #points per trigger
+        self.t0 = None #start of the current output, None while waiting for a trigger
+        self.done = 0 #points output before t0
+        self.end_call = None
+
+    def count(self, now):
+        """
+        Points output so far
+        """
+        if self.t0 is None:
+            return self.done
+        count = self.done + int((now - self.t0)*self.rate + 1e-6) #tolerance for float time
+        if self.segment is not None:
+            count = min(count, self.done + self.segment) #waits for the next trigger
+        if not self.continuous:
+            count = min(count, self.num_points)
+        return count
+
+    def end_time(self):
+        """
+        Clock time at which a single scan ends, None if it does not end in the current output
+        """
+        if self.continuous or self.t0 is None:
+            return None
+        remaining = self.num_points - self.done
+        if self.segment is not None and remaining > self.segment:
+            return None
+        return self.t0 + remaining/self.rate
+
+class _Board:
+    def __init__(self, device):
+        self.device = device
+        self.scan = None
+        self.last = (0, -1) #cur_count, cur_index of the last scan
+        self.config = {}
+        self.trig_type = None
+        self.events = {} #event type: (callback, user_data)
+        self.dio = {} #bit: value
+        self.outputs = [32768]*device.num_dac_chans #last a_out value of each channel
+
+devices = [SimDevice()] #inventory returned by get_daq_device_inventory
+clock = RealClock()
+dio_trigger = True #a rising digital output edge triggers all boards, as wired for multi-board mode
+_boards = {} #board_num: _Board
+_buffers = {} #memhandle: ctypes array
+_lock = threading.RLock()
+
+def configure(devices=None, clock=None, dio_trigger=True):
+    """
+    Reset the simulator: release all boards and buffers and set up the inventory and the clock
+
+    devices: list of SimDevice or None
+        default: one USB-3101FS
+    clock: RealClock, VirtualClock or None
+        default: RealClock
+    dio_trigger: bool
+        True: a rising edge on any digital output bit triggers every armed board
+    """
+    with _lock:
+        for board in _boards.values():
+            _stop(board)
+        _boards.clear()
+        _buffers.clear()
+        globals()['devices'] = [SimDevice()] if devices is None else list(devices)
+        globals()['clock'] = RealClock() if clock is None else clock
+        globals()['dio_trigger'] = dio_trigger
+
+def _board(board_num):
+    board = _boards.get(board_num)
+    if board is None:
+        raise ULError(ErrorCode.BADBOARD)
+    return board
+
+def _stop(board):
+    scan = board.scan
+    if scan is not None:
+        count = scan.count(clock.now())
+        board.last = (count, (count - 1) % scan.num_points if count else -1)
+        if scan.end_call is not None:
+            scan.end_call.cancel()
+        board.scan = None
+
+def _finish(board_num, scan):
+    """
+    End of a single scan: board goes idle and the ON_END_OF_AO_SCAN event fires (once)
+    """
+    with _lock:
+        board = _boards.get(board_num)
+        if board is None or board.scan is not scan:
+            return
+        _stop(board)
+        event = board.events.get(EventType.ON_END_OF_AO_SCAN)
+    if event is not None:
+        callback, user_data = event
+        callback(board_num, EventType.ON_END_OF_AO_SCAN, scan.num_points, user_data)
+
+def _start_output(board_num, board, scan):
+    scan.t0 = clock.now()
+    end = scan.end_time()
+    if end is not None:
+        scan.end_call = clock.call_at(end, lambda: _finish(board_num, scan))
+
+def trigger(board_nums=None):
+    """
+    Simulated TTL edge on the TRIG input of the given boards (all by default): starts armed scans
+    (see ScanOptions.EXTTRIGGER) and, in retrigger mode, the next segment of scans waiting for a trigger.
+    Triggers arriving while a segment is output are ignored, as on the real board.
+    """
+    with _lock:
+        now = clock.now()
+        for board_num, board in list(_boards.items()):
+            scan = board.scan
+            if scan is None or (board_nums is not None and board_num not in board_nums):
+                continue
+            if scan.t0 is None:
+                _start_output(board_num, board, scan)
+            elif scan.segment is not None and scan.count(now) - scan.done >= scan.segment:
+                scan.done += scan.segment
+                _start_output(board_num, board, scan)
+
+def analog_outputs(board_num):
+    """
+    Returns the last value written to each AO channel with a_out (DAC codes)
+    """
+    return list(_board(board_num).outputs)
+
+#---------- mcculw.ul API ----------
+
+def ignore_instacal():
+    pass
+
+def get_daq_device_inventory(interface_type, number_of_devices=100):
+    return list(devices[:number_of_devices])
+
+def create_daq_device(board_num, descriptor):
+    with _lock:
+        if board_num in _boards:
+            raise ULError(ErrorCode.BOARDNUMINUSE)
+        _boards[board_num] = _Board(descriptor)
+
+def release_daq_device(board_num):
+    with _lock:
+        _stop(_board(board_num))
+        del _boards[board_num]
+
+def get_config(info_type, board_num, dev_num, config_item):
+    board = _board(board_num)
+    if config_item == BoardInfo.NUMDACHANS:
+        return board.device.num_dac_chans
+    return board.config.get(config_item, 0)
+
+def set_config(info_type, board_num, dev_num, config_item, config_val):
+    _board(board_num).config[config_item] = config_val
+
+def set_trigger(board_num, trig_type, low_threshold, high_threshold):
+    _board(board_num).trig_type = trig_type
+
+def win_buf_alloc(num_points):
+    if num_points <= 0:
+        return 0
+    buffer = (ctypes.c_ushort*num_points)()
+    memhandle = ctypes.addressof(buffer)
+    with _lock:
+        _buffers[memhandle] = buffer
+    return memhandle
+
+def win_buf_free(memhandle):
+    with _lock:
+        if _buffers.pop(memhandle, None) is None:
+            raise ULError(ErrorCode.BAD_MEM_HANDLE)
+
+def a_out_scan(board_num, low_chan, high_chan, num_points, rate, ul_range, memhandle, options):
+    with _lock:
+        board = _board(board_num)
+        device = board.device
+        num_channels = high_chan - low_chan + 1
+        if low_chan < 0 or num_channels < 1 or high_chan >= device.num_dac_chans:
+            raise ULError(ErrorCode.BADDACHAN)
+        buffer = _buffers.get(memhandle)
+        if buffer is None:
+            raise ULError(ErrorCode.BAD_MEM_HANDLE)
+        if num_points <= 0 or num_points % num_channels or num_points > len(buffer):
+            raise ULError(ErrorCode.BADCOUNT)
+        if rate <= 0 or rate > device.max_rate_per_channel or rate*num_channels > device.max_rate_aggregate:
+            raise ULError(ErrorCode.BADRATE)
+        if board.scan is not None:
+            if board.scan.count(clock.now()) < board.scan.num_points or board.scan.continuous:
+                raise ULError(ErrorCode.ALREADYACTIVE)
+            _stop(board)
+    clock.sleep(device.start_latency)
+    with _lock:
+        scan = _Scan(num_points, rate*num_channels, options, int(board.config.get(BoardInfo.DACTRIGCOUNT, 0)))
+        board.scan = scan
+        if not options & ScanOptions.EXTTRIGGER:
+            _start_output(board_num, board, scan)
+    return rate
+
+def get_status(board_num, function_type):
+    with _lock:
+        board = _board(board_num)
+        scan = board.scan
+        if scan is None:
+            return Status.IDLE, board.last[0], board.last[1]
+        count = scan.count(clock.now())
+        ended = not scan.continuous and count >= scan.num_points
+    if ended:
+        _finish(board_num, scan) #in case the clock got ahead of the end of scan timer
+        return Status.IDLE, count, count - 1
+    return Status.RUNNING, count, (count - 1) % scan.num_points if count else -1
+
+def stop_background(board_num, function_type):
+    with _lock:
+        _stop(_board(board_num))
+
+def a_out(board_num, channel, ul_range, data_value):
+    board = _board(board_num)
+    if not 0 <= channel < board.device.num_dac_chans:
+        raise ULError(ErrorCode.BADDACHAN)
+    board.outputs[channel] = data_value
+
+def d_config_port(board_num, port_type, direction):
+    _board(board_num)
+
+def d_bit_out(board_num, port_type, bit_num, bit_value):
+    board = _board(board_num)
+    rising = bit_value and not board.dio.get(bit_num, 0)
+    board.dio[bit_num] = bit_value
+    if rising and dio_trigger:
+        trigger()
+
+def enable_event(board_num, event_type, event_param, callback_func, c_user_data):
+    board = _board(board_num)
+    for event in EventType:
+        if event & event_type:
+            board.events[event] = (callback_func, c_user_data)
+
+def disable_event(board_num, event_type):
+    board = _board(board_num)
+    for event in list(board.events):
+        if event & event_type:
+            del board.events[event]
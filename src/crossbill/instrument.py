@@ -0,0 +1,263 @@
+"""
+Per-call latency instrumentation for DAQ and stage drivers.
+
+A CallRecorder wraps the methods of MCCdaq/MCL_MicroDrive objects and the underlying UL (crossbill.daq.ul) and
+MCL DLL calls, recording monotonic start/end time, arguments and outcome of every call into a bounded ring.
+The ring gives percentile summaries and exports to a Chrome trace (chrome://tracing, https://ui.perfetto.dev)
+for timeline analysis. Instrumentation is opt-in: nothing is recorded until a recorder is attached.
+    recorder = CallRecorder()
+    recorder.attach(daq_or_stage_object)
+    ...
+    print(recorder.report())
+    recorder.export_chrome_trace('crossbill_trace.json')
+
+MIT License
+
+Copyright (c) 2021 Manish Kumar
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import numpy as np
+import collections, contextlib, functools, json, os, threading, time
+
+#one recorded call. start, end: monotonic clock (s). thread: thread ident. args: short descriptions of the arguments
+#error: None if the call returned, otherwise a description of the exception raised
+CallRecord = collections.namedtuple('CallRecord', ['name', 'category', 'start', 'end', 'thread', 'args', 'error'])
+
+#latency summary of one call name (times in s)
+CallStats = collections.namedtuple('CallStats', ['count', 'errors', 'total', 'p50', 'p90', 'p99', 'max'])
+
+def _describe(value):
+    """
+    Short description of an argument, cheap enough to take on every call
+    """
+    if isinstance(value, np.ndarray):
+        return f'array{value.shape} {value.dtype}'
+    if isinstance(value, (bool, int, float)) or value is None:
+        return value
+    if isinstance(value, str):
+        return value if len(value) <= 40 else value[:37] + '...'
+    if hasattr(value, 'value') and isinstance(value.value, (int, float)): #ctypes simple types, enums
+        return f'{type(value).__name__}({value.value})'
+    return type(value).__name__
+
+class _TracedCall:
+    """
+    Callable recording each call of func, other attributes (e.g. ctypes argtypes/restype) pass through to func
+    """
+    def __init__(self, recorder, func, name, category):
+        self.__dict__.update(_recorder=recorder, _func=func, _name=name, _category=category)
+
+    def __call__(self, *args, **kwargs):
+        return self._recorder.call(self._func, self._name, self._category, args, kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self._func, attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._func, attr, value)
+
+class _TracedLibrary:
+    """
+    Stands in for a driver (module or ctypes library), recording calls of its functions.
+    Classes (e.g. ULError) and other attributes are returned as they are.
+    """
+    def __init__(self, recorder, library, category):
+        self.__dict__.update(_recorder=recorder, _library=library, _category=category, _calls={})
+
+    def __getattr__(self, attr):
+        call = self._calls.get(attr)
+        if call is None:
+            value = getattr(self._library, attr)
+            if not callable(value) or isinstance(value, type):
+                return value
+            call = self._calls[attr] = _TracedCall(self._recorder, value, attr, self._category)
+        return call
+
+    def __setattr__(self, attr, value):
+        setattr(self._library, attr, value)
+
+class CallRecorder:
+    """
+    Records driver calls into a bounded in-memory ring (oldest records are dropped once full).
+
+    max_records: int
+        size of the ring
+    record_args: bool
+        keep short descriptions of the arguments of each call
+    """
+    def __init__(self, max_records=100000, record_args=True):
+        self.clock = time.perf_counter #monotonic, highest resolution available
+        self.record_args = record_args
+        self.enabled = True
+        self._records = collections.deque(maxlen=max_records) #appends are thread-safe
+        self._attached = [] #(object, attribute, original) to restore on detach
+
+    def __len__(self):
+        return len(self._records)
+
+    def record(self, name, category, start, end, args=(), error=None):
+        """
+        Add a record, e.g. for a section of an imaging loop timed by the caller
+        """
+        if self.enabled:
+            self._records.append(CallRecord(name, category, start, end, threading.get_ident(), args, error))
+
+    def call(self, func, name, category, args, kwargs):
+        """
+        Call func(*args, **kwargs) and record it
+        """
+        if not self.enabled:
+            return func(*args, **kwargs)
+        error = None
+        start = self.clock()
+        try:
+            return func(*args, **kwargs)
+        except BaseException as e:
+            error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            end = self.clock()
+            described = ()
+            if self.record_args:
+                described = tuple(_describe(arg) for arg in args) + tuple(f'{key}={_describe(arg)}' for key, arg in kwargs.items())
+            self._records.append(CallRecord(name, category, start, end, threading.get_ident(), described, error))
+
+    def wrap(self, func, name=None, category='call'):
+        """
+        Returns func wrapped so that each call gets recorded
+        """
+        name = name or func.__name__
+        @functools.wraps(func)
+        def traced(*args, **kwargs):
+            return self.call(func, name, category, args, kwargs)
+        return traced
+
+    @contextlib.contextmanager
+    def span(self, name, category='section'):
+        """
+        Context manager recording the time spent in a block of code, e.g. one tile of structural imaging
+        """
+        start = self.clock()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            self.record(name, category, start, self.clock(), (), error)
+
+    def attach(self, obj):
+        """
+        Instrument an MCCdaq and/or MCL_MicroDrive object (e.g. the GUI window, which is both): its methods,
+        the UL backend of crossbill.daq (calls from any MCCdaq object, and sleep-polls of crossbill.daq) and its MCL DLL.
+        The MCL DLL is replaced by MCL_MicroDrive.__init__, so attach after connecting the stage.
+        Attaching again only instruments what is new.
+        """
+        from crossbill import daq
+        from crossbill.stage import MCL_MicroDrive
+        for cls, category in ((daq.MCCdaq, 'daq'), (MCL_MicroDrive, 'stage')):
+            if not isinstance(obj, cls):
+                continue
+            for name, value in vars(cls).items():
+                if callable(value) and not name.startswith('__') and name not in vars(obj):
+                    self._patch(obj, name, self.wrap(getattr(obj, name), f'{cls.__name__}.{name}', category))
+        if isinstance(obj, daq.MCCdaq) and not isinstance(daq.ul, _TracedLibrary):
+            original = daq.ul
+            daq.use_backend(_TracedLibrary(self, original, 'ul'))
+            self._attached.append((daq, 'use_backend', original))
+            self._patch(daq, 'sleep', self.wrap(daq.sleep, 'sleep', 'sleep'))
+        dll = getattr(obj, 'MCLMicroDriveDll', None)
+        if dll is not None and not isinstance(dll, _TracedLibrary):
+            self._patch(obj, 'MCLMicroDriveDll', _TracedLibrary(self, dll, 'MCL'))
+
+    def detach(self):
+        """
+        Remove all instrumentation added by attach (records are kept)
+        """
+        while self._attached:
+            obj, name, original = self._attached.pop()
+            if name == 'use_backend':
+                obj.use_backend(original)
+            elif original is None:
+                delattr(obj, name) #instance attribute that shadowed a method
+            else:
+                setattr(obj, name, original)
+
+    def _patch(self, obj, name, value):
+        self._attached.append((obj, name, vars(obj).get(name)))
+        setattr(obj, name, value)
+
+    def records(self, category=None):
+        """
+        Returns a list of the records in the ring (of one category if given), oldest first
+        """
+        records = list(self._records)
+        if category is not None:
+            records = [record for record in records if record.category == category]
+        return records
+
+    def clear(self):
+        self._records.clear()
+
+    def summary(self, category=None):
+        """
+        Returns {name: CallStats} over the records in the ring (of one category if given)
+        """
+        durations = collections.defaultdict(list)
+        errors = collections.Counter()
+        for record in self.records(category):
+            durations[record.name].append(record.end - record.start)
+            if record.error is not None:
+                errors[record.name] += 1
+        stats = {}
+        for name, values in durations.items():
+            values = np.array(values)
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            stats[name] = CallStats(len(values), errors[name], values.sum(), p50, p90, p99, values.max())
+        return stats
+
+    def report(self, category=None):
+        """
+        Returns the summary as a text table (times in ms), calls with the most total time first
+        """
+        lines = [f"{'call':<40} {'count':>7} {'errors':>6} {'total':>10} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}"]
+        stats = sorted(self.summary(category).items(), key=lambda item: -item[1].total)
+        for name, s in stats:
+            lines.append(f'{name:<40} {s.count:>7} {s.errors:>6} {s.total*1e3:>10.1f} {s.p50*1e3:>9.3f} {s.p90*1e3:>9.3f} {s.p99*1e3:>9.3f} {s.max*1e3:>9.3f}')
+        return '\n'.join(lines) + '\n'
+
+    def export_chrome_trace(self, filename):
+        """
+        Write the records as a Chrome trace (JSON array of complete events), to be opened in chrome://tracing or Perfetto
+
+        filename: str or pathlib.Path
+        """
+        records = self.records()
+        origin = min((record.start for record in records), default=0.0)
+        events = []
+        for record in records:
+            args = {'args': [a if isinstance(a, (bool, int, float, str)) or a is None else str(a) for a in record.args]}
+            if record.error is not None:
+                args['error'] = record.error
+            events.append({'name': record.name, 'cat': record.category, 'ph': 'X', 'pid': os.getpid(), 'tid': record.thread,
+                'ts': (record.start - origin)*1e6, 'dur': (record.end - record.start)*1e6, 'args': args})
+        with open(filename, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
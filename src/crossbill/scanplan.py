@@ -0,0 +1,128 @@
+"""
+Scan-path planning for tiled (structural) imaging.
+
+A plan is the list of tiles of a mosaic in acquisition order (Tile records). Besides the stage positions to visit,
+each tile carries its row/column in the mosaic, so that images acquired in any order can be put back in place.
+    tiles = plan('serpentine', y_start, x_start, y_step, x_step, y_tiles, x_tiles)
+    motion_time(tiles, velocity)
+
+Orderings (see PLANNERS):
+- raster: column by column, each column along +Y (return travel to the first row between columns)
+- serpentine: boustrophedon, columns alternately along +Y and -Y (no return travel)
+- serpentine_rows: boustrophedon row by row, rows alternately along +X and -X
+- shortest: whichever serpentine has the shorter motion time
+
+MIT License
+
+Copyright (c) 2021 Manish Kumar
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import collections, math
+
+#one tile of a mosaic. index: acquisition order, row/column: place in the mosaic along Y/X (all from 0)
+#y, x: stage position in µm
+Tile = collections.namedtuple('Tile', ['index', 'row', 'column', 'y', 'x'])
+
+def tiles_within(neg_lim, pos_lim, step):
+    """
+    Function returning the number of whole tiles (of size step) fitting from neg_lim to pos_lim, so that the last tile
+    does not run past pos_lim. A remainder is left out, there is at least one tile.
+    """
+    return max(1, math.floor(round(abs(pos_lim - neg_lim)/step, 6))) #rounding: no missing tile for float noise
+
+def _tiles(cells, y_start, x_start, y_step, x_step):
+    """
+    Tile records for (row, column) cells in acquisition order
+    """
+    return [Tile(index, row, column, y_start + row*y_step, x_start + column*x_step) for index, (row, column) in enumerate(cells)]
+
+def raster(y_start, x_start, y_step, x_step, y_tiles, x_tiles):
+    """
+    Column by column, each column along +Y: the stage travels back to the first row before each new column
+
+    y_start, x_start: float
+        position of the first tile (µm)
+    y_step, x_step: float
+        tile size, i.e. distance between neighbouring tiles (µm)
+    y_tiles, x_tiles: int
+        number of rows and columns
+    """
+    cells = [(row, column) for column in range(x_tiles) for row in range(y_tiles)]
+    return _tiles(cells, y_start, x_start, y_step, x_step)
+
+def serpentine(y_start, x_start, y_step, x_step, y_tiles, x_tiles):
+    """
+    Boustrophedon (snake) column by column: even columns along +Y, odd ones along -Y, so no return travel.
+    Rows of alternate columns are approached from opposite directions, mind the stage backlash when stitching.
+    Parameters as for raster.
+    """
+    cells = [(row if column % 2 == 0 else y_tiles - 1 - row, column) for column in range(x_tiles) for row in range(y_tiles)]
+    return _tiles(cells, y_start, x_start, y_step, x_step)
+
+def serpentine_rows(y_start, x_start, y_step, x_step, y_tiles, x_tiles):
+    """
+    Boustrophedon (snake) row by row: even rows along +X, odd ones along -X. Parameters as for raster.
+    """
+    cells = [(row, column if row % 2 == 0 else x_tiles - 1 - column) for row in range(y_tiles) for column in range(x_tiles)]
+    return _tiles(cells, y_start, x_start, y_step, x_step)
+
+def shortest(y_start, x_start, y_step, x_step, y_tiles, x_tiles):
+    """
+    The serpentine (by columns or by rows) with the shorter motion time, returning to the start at the end.
+    Parameters as for raster.
+    """
+    plans = [planner(y_start, x_start, y_step, x_step, y_tiles, x_tiles) for planner in (serpentine, serpentine_rows)]
+    return min(plans, key=lambda tiles: motion_time(tiles, 1.0, end=(y_start, x_start)))
+
+PLANNERS = {'raster': raster, 'serpentine': serpentine, 'serpentine_rows': serpentine_rows, 'shortest': shortest}
+
+def plan(order, y_start, x_start, y_step, x_step, y_tiles, x_tiles):
+    """
+    Function returning the tiles of a y_tiles x x_tiles mosaic in the acquisition order of a planner
+
+    order: str
+        key of PLANNERS ('raster', 'serpentine', 'serpentine_rows' or 'shortest')
+    Other parameters as for raster.
+    """
+    return PLANNERS[order](y_start, x_start, y_step, x_step, y_tiles, x_tiles)
+
+def motion_time(tiles, velocity, start=None, end=None, overhead=0.0):
+    """
+    Function estimating the stage motion time (s) of visiting the tiles in order. The axes move one after the other
+    (see crossbill.stage.MCL_MicroDrive.stage_queue_moves), so a move takes |dy|/velocity + |dx|/velocity.
+
+    velocity: float
+        mm/s
+    start, end: (y, x) in µm or None
+        position before the first tile (the first tile if None), after the last one (e.g. back to the start)
+    overhead: float
+        fixed time (s) per axis move, e.g. acceleration and settling
+    """
+    points = [(tile.y, tile.x) for tile in tiles]
+    if start is not None:
+        points.insert(0, start)
+    if end is not None:
+        points.append(end)
+    total = 0.0
+    for (y0, x0), (y1, x1) in zip(points, points[1:]):
+        for distance in (abs(y1 - y0), abs(x1 - x0)):
+            if distance > 0:
+                total += distance*1e-3/velocity + overhead
+    return total
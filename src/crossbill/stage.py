@@ -2,6 +2,7 @@
 Control functions for MCL translation stage.
 
 This module file consists of a MCLMicroDrive class. Import this module and make use of this class to interact with the translation stage. 
+AsyncStage wraps a connected MCL_MicroDrive object for asyncio code (awaitable moves).
 More classes can be added to support more tanslation stages.
 
 MIT License
@@ -26,6 +27,37 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
+import collections #used at import time (Waypoint), other libraries are imported at the end of the module
+
+def _mcl_prototypes():
+    """
+    Returns {function name: (restype, argtypes)} of the MCL MicroDrive DLL functions in use (see MicroDrive.h).
+    argtypes None: functions of the paths run around every move (position read, move submission), only called with
+    ready-made arguments (int, reused ctypes.c_double, prebuilt byref). ctypes converts each argument through from_param when
+    argtypes are set, which costs more than the call itself (~0.9 µs vs 0.3 µs per position read, benchmarks/stage_calls.py).
+    """
+    c_short_p = ctypes.POINTER(ctypes.c_short)
+    c_double_p = ctypes.POINTER(ctypes.c_double)
+    c_int = ctypes.c_int
+    return {
+        'MCL_InitHandle': (c_int, []),
+        'MCL_GetSerialNumber': (c_int, [c_int]),
+        'MCL_GetFirmwareVersion': (c_int, [c_short_p, c_short_p, c_int]),
+        'MCL_DLLVersion': (None, [c_short_p, c_short_p]),
+        'MCL_GetFullStepSize': (c_int, [c_double_p, c_int]),
+        'MCL_MDInformation': (c_int, [c_double_p]*6 + [c_int]),
+        'MCL_ReleaseHandle': (None, [c_int]),
+        'MCL_MDStop': (c_int, [ctypes.POINTER(ctypes.c_ushort), c_int]),
+        'MCL_MicroDriveWait': (c_int, [c_int]),
+        'MCL_MDCurrentPositionM': (c_int, None), #(c_uint axis, c_int_p microSteps, c_int handle)
+        'MCL_MDMove': (c_int, None), #(c_uint axis, c_double velocity, c_double distance, c_int handle)
+        'MCL_MDMoveThreeAxes': (c_int, None), #(c_uint axis, c_double velocity, c_double distance)*3, c_int handle
+        'MCL_MDSingleStep': (c_int, None), #(c_uint axis, c_int direction, c_int handle)
+    }
+
+#target of a queued stage move (see MCL_MicroDrive.stage_queue_moves)
+#y, x: µm, absolute (as stage_YXposition) or relative to the previous position. velocity: mm/s
+Waypoint = collections.namedtuple('Waypoint', ['y', 'x', 'velocity', 'relative'])
 
 class MCL_MicroDrive():
     """
@@ -43,6 +75,11 @@ class MCL_MicroDrive():
     - stage_moveX
     - stage_halt
     - stage_wait    
+    - stage_start_sampler/stage_stop_sampler (background position sampling)
+    - stage_latestposition
+    - stage_trajectory
+    - stage_export_trajectory
+    - stage_queue_moves/stage_cancel_moves/stage_wait_moves (waypoint motion queue)
 
     List of variables:
     - stage_YXposition 
@@ -62,6 +99,35 @@ class MCL_MicroDrive():
                 self.msg += "Identified 64-bit MadCityLabs (MCL) DLL ...\n"
             except:
                 self.msg += "\U000026A0 Could not identify any MCL DLL files. Ensure that DLL files exist in the expected paths ...\n"
+        self._stage_bind()
+
+        #arguments of DLL calls, allocated once: outputs passed by reference (ctypes.byref), move arguments set through .value
+        self._stage_lock = threading.Lock() #one DLL call at a time per argument/output buffer
+        self._stage_velocity = ctypes.c_double() #mm/s
+        self._stage_Ydistance = ctypes.c_double() #mm
+        self._stage_Xdistance = ctypes.c_double() #mm
+        self._stage_Zdistance = ctypes.c_double(0.0) #third axis of MCL_MDMoveThreeAxes, never moved
+        self._stage_Ysteps = ctypes.c_int()
+        self._stage_Xsteps = ctypes.c_int()
+        self._stage_status = ctypes.c_ushort()
+        self._stage_Yref = ctypes.byref(self._stage_Ysteps)
+        self._stage_Xref = ctypes.byref(self._stage_Xsteps)
+        self._stage_statusref = ctypes.byref(self._stage_status)
+
+        #background position sampler (see stage_start_sampler): ring of (monotonic time in s, Y in µm, X in µm)
+        self.stage_sampler_thread = None
+        self.stage_sampler_stop = threading.Event()
+        self.stage_samples = np.zeros((0, 3))
+        self.stage_sample_count = 0 #samples written since the start, the latest one is at (stage_sample_count - 1) % len(stage_samples)
+        self._stage_samplelock = threading.Lock()
+
+        #waypoint motion queue (see stage_queue_moves): (generation, index, Waypoint, callback) run by one driver thread
+        self.stage_queue = collections.deque()
+        self.stage_driver_thread = None
+        self.stage_queue_idle = threading.Event() #set while no queued move is pending or running
+        self.stage_queue_idle.set()
+        self._stage_generation = 0 #incremented by stage_cancel_moves, moves queued before get dropped
+        self._stage_queuelock = threading.Lock()
 
         #python variables
         self.stage_YXposition = [0.0,0.0] #list of two floats. index 0: Axis-1/Y & index 1: Axis-2/X
@@ -81,6 +147,23 @@ class MCL_MicroDrive():
                                 -8: 'MCL_INVALID_HANDLE'}        
          
 
+    def _stage_bind(self):
+        """
+        Bind the DLL functions once with their prototypes (restype, and argtypes except on the move/position paths,
+        see _mcl_prototypes): void functions return None and wrong arguments raise instead of corrupting the call.
+        """
+        dll = getattr(self, 'MCLMicroDriveDll', None)
+        if dll is None:
+            return
+        for name, (restype, argtypes) in _mcl_prototypes().items():
+            try:
+                function = getattr(dll, name)
+            except AttributeError:
+                self.msg += f"\U000026A0 {name} missing from the MCL DLL\n"
+                continue
+            function.restype = restype
+            function.argtypes = argtypes
+
     def stage_connect(self):        
         try:
             self.stage_handle = self.MCLMicroDriveDll.MCL_InitHandle()
@@ -97,7 +180,7 @@ class MCL_MicroDrive():
 
                 DLLversion = ctypes.pointer(ctypes.c_short())
                 DLLrevision = ctypes.pointer(ctypes.c_short())
-                self.MCLMicroDriveDll.MCL_DLLVersion(DLLrevision,DLLrevision)
+                self.MCLMicroDriveDll.MCL_DLLVersion(DLLversion,DLLrevision)
                 # self.msg += 'MCL DLL details. Version: ' + str(DLLversion.contents.value) + ' and revision: ' + str(DLLrevision.contents.value) +'\n'
                 del DLLrevision,DLLversion
 
@@ -161,6 +244,7 @@ class MCL_MicroDrive():
         '''
         Disconnect stage
         '''
+        self.stage_stop_sampler()
         self.stage_halt()        
         self.MCLMicroDriveDll.MCL_ReleaseHandle(self.stage_handle)
         self.stage_handle = None
@@ -171,11 +255,10 @@ class MCL_MicroDrive():
         '''
         Halt moving stage 
         '''        
-        status = ctypes.pointer(ctypes.c_ushort()) #unsigned short pointer
-        errorNum = self.MCLMicroDriveDll.MCL_MDStop(status, self.stage_handle)        
+        with self._stage_lock:
+            errorNum = self.MCLMicroDriveDll.MCL_MDStop(self._stage_statusref, self.stage_handle)
         if errorNum != 0:
             self.msg += '\U000026A0 Error while stopping stage: ' + self.errorDictionary[errorNum] 
-        del status, errorNum
 
 
     def stage_wait(self):
@@ -185,7 +268,6 @@ class MCL_MicroDrive():
         errorNum = self.MCLMicroDriveDll.MCL_MicroDriveWait(self.stage_handle)
         if errorNum != 0:
             self.msg += '\U000026A0 Error while waiting for the stage move to finish: ' + self.errorDictionary[errorNum]
-        del errorNum
 
 
     def stage_getcurrentposition(self):
@@ -195,22 +277,184 @@ class MCL_MicroDrive():
         Warning! Call it only when stage has finished moving. 
         Call self.stage_wait() prior to this function.       
         '''        
-        YmicroSteps = ctypes.pointer(ctypes.c_int())
-        XmicroSteps = ctypes.pointer(ctypes.c_int())
-
-        Yaxis = ctypes.c_uint(1) #Axis-1 is Y-axis in our SOPi microscope's lab co-ordinates
-        Xaxis = ctypes.c_uint(2) 
-        
-        errorNum = self.MCLMicroDriveDll.MCL_MDCurrentPositionM(Xaxis, XmicroSteps, self.stage_handle)
-        if errorNum != 0:
-            self.msg += '\n\n\U000026A0 Error while locating X position: ' + self.errorDictionary[errorNum]
-        errorNum = self.MCLMicroDriveDll.MCL_MDCurrentPositionM(Yaxis, YmicroSteps, self.stage_handle)
-        if errorNum != 0:
-            self.msg += '\n\n\U000026A0 Error while locating Y position: ' + self.errorDictionary[errorNum]
+        YerrorNum, XerrorNum, YmicroSteps, XmicroSteps = self._stage_readsteps()
+        if XerrorNum != 0:
+            self.msg += '\n\n\U000026A0 Error while locating X position: ' + self.errorDictionary[XerrorNum]
+        if YerrorNum != 0:
+            self.msg += '\n\n\U000026A0 Error while locating Y position: ' + self.errorDictionary[YerrorNum]
         
-        self.stage_YXposition[0] = round(float(YmicroSteps.contents.value*self.MicroStepSize - self.Yoffset),5) #in µm
-        self.stage_YXposition[1] = round(float(XmicroSteps.contents.value*self.MicroStepSize - self.Xoffset),5) #in µm
-        del Xaxis, Yaxis, errorNum, XmicroSteps, YmicroSteps
+        self.stage_YXposition[0] = round(float(YmicroSteps*self.MicroStepSize - self.Yoffset),5) #in µm
+        self.stage_YXposition[1] = round(float(XmicroSteps*self.MicroStepSize - self.Xoffset),5) #in µm
+
+    def _stage_readsteps(self):
+        """
+        Returns (Y error number, X error number, Y microsteps, X microsteps) read from the DLL
+        """
+        #Axis-1 is Y-axis in our SOPi microscope's lab co-ordinates, Axis-2 is X-axis
+        with self._stage_lock:
+            XerrorNum = self.MCLMicroDriveDll.MCL_MDCurrentPositionM(2, self._stage_Xref, self.stage_handle)
+            YerrorNum = self.MCLMicroDriveDll.MCL_MDCurrentPositionM(1, self._stage_Yref, self.stage_handle)
+            return YerrorNum, XerrorNum, self._stage_Ysteps.value, self._stage_Xsteps.value
+
+    def stage_start_sampler(self, rate=50, size=100000):
+        """
+        Start a thread reading both axes at a fixed rate into a ring buffer (self.stage_samples) of
+        (monotonic time in s (time.perf_counter), Y in µm, X in µm), also while the stage moves.
+        Readers get positions from the ring (stage_latestposition, stage_trajectory) without calling the DLL.
+        Reads failing in the DLL are skipped.
+
+        rate: float
+            samples per second
+        size: int
+            number of samples kept (oldest ones get overwritten), e.g. 100000 at 50/s: ~33 min
+        """
+        self.stage_stop_sampler()
+        with self._stage_samplelock:
+            self.stage_samples = np.zeros((int(size), 3))
+            self.stage_sample_count = 0
+        self.stage_sampler_stop.clear()
+        self.stage_sampler_thread = threading.Thread(target=self._stage_sample, args=(1/rate,), daemon=True)
+        self.stage_sampler_thread.start()
+        self.msg += f'Sampling stage position at {rate} Hz ...\n'
+
+    def stage_stop_sampler(self):
+        """
+        Stop the sampler thread, samples stay available
+        """
+        thread = self.stage_sampler_thread
+        if thread is not None:
+            self.stage_sampler_stop.set()
+            thread.join()
+            self.stage_sampler_thread = None
+
+    def _stage_sample(self, interval):
+        next_time = time.perf_counter()
+        while not self.stage_sampler_stop.is_set():
+            YerrorNum, XerrorNum, YmicroSteps, XmicroSteps = self._stage_readsteps()
+            now = time.perf_counter()
+            if YerrorNum == 0 and XerrorNum == 0:
+                with self._stage_samplelock:
+                    self.stage_samples[self.stage_sample_count % len(self.stage_samples)] = (now,
+                        YmicroSteps*self.MicroStepSize - self.Yoffset, XmicroSteps*self.MicroStepSize - self.Xoffset)
+                    self.stage_sample_count += 1
+            next_time = max(next_time + interval, now) #no burst of reads to catch up after a stall
+            self.stage_sampler_stop.wait(next_time - now)
+
+    def stage_latestposition(self):
+        """
+        Returns the latest sample (time in s, Y in µm, X in µm) of the sampler, None if there is none
+        """
+        with self._stage_samplelock:
+            if self.stage_sample_count == 0:
+                return None
+            return tuple(self.stage_samples[(self.stage_sample_count - 1) % len(self.stage_samples)].tolist())
+
+    def stage_trajectory(self, since=None):
+        """
+        Returns the samples in the ring as an (n, 3) numpy array (time in s, Y in µm, X in µm), oldest first
+
+        since: float or None
+            only samples taken at or after this time (time.perf_counter)
+        """
+        with self._stage_samplelock:
+            size = len(self.stage_samples)
+            count = self.stage_sample_count
+            if count <= size:
+                samples = self.stage_samples[:count].copy()
+            else:
+                samples = np.roll(self.stage_samples, -(count % size), axis=0)
+        if since is not None:
+            samples = samples[np.searchsorted(samples[:, 0], since):]
+        return samples
+
+    def stage_export_trajectory(self, filename, since=None):
+        """
+        Save the samples (see stage_trajectory) as a CSV file with the columns time_s, y_um, x_um, e.g. to register tiles
+        against the actual stage positions. Times are time.perf_counter values, as in crossbill.instrument traces.
+        """
+        np.savetxt(filename, self.stage_trajectory(since), delimiter=',', header='time_s,y_um,x_um', comments='', fmt=['%.6f', '%.3f', '%.3f'])
+
+    def stage_queue_moves(self, waypoints, callback=None):
+        """
+        Queue moves through a list of waypoints. A single driver thread executes them back to back
+        (Y then X axis, waiting for the end of each move) and calls callback(index, (y, x)) after reaching each
+        waypoint, e.g. to image a tile there. The next move starts once the callback returns.
+        Moves queued while others are pending are appended. Returns right away, see stage_wait_moves.
+
+        waypoints: list of Waypoint
+        callback: function or None
+            index: position of the waypoint in waypoints, (y, x): position reached in µm
+        """
+        with self._stage_queuelock:
+            self.stage_queue.extend((self._stage_generation, index, waypoint, callback) for index, waypoint in enumerate(waypoints))
+            if not self.stage_queue:
+                return
+            self.stage_queue_idle.clear()
+            if self.stage_driver_thread is None:
+                self.stage_driver_thread = threading.Thread(target=self._stage_drive, daemon=True)
+                self.stage_driver_thread.start()
+
+    def stage_cancel_moves(self):
+        """
+        Drop the queued moves and halt the running one (its callback is not called)
+        """
+        with self._stage_queuelock:
+            self._stage_generation += 1
+            self.stage_queue.clear()
+        self.stage_halt()
+
+    def stage_wait_moves(self, timeout=None):
+        """
+        Wait till all queued moves (and their callbacks) are done. Returns False on timeout.
+        """
+        return self.stage_queue_idle.wait(timeout)
+
+    def _stage_drive(self):
+        """
+        Driver thread of the motion queue
+        """
+        while True:
+            with self._stage_queuelock:
+                if not self.stage_queue:
+                    self.stage_driver_thread = None
+                    self.stage_queue_idle.set()
+                    return
+                generation, index, waypoint, callback = self.stage_queue.popleft()
+                if generation != self._stage_generation:
+                    continue
+            if waypoint.relative:
+                y, x = waypoint.y, waypoint.x
+            else:
+                self.stage_getcurrentposition()
+                y, x = waypoint.y - self.stage_YXposition[0], waypoint.x - self.stage_YXposition[1]
+            position = self._stage_moveby(y, x, waypoint.velocity, lambda: generation == self._stage_generation)
+            if callback is not None and generation == self._stage_generation:
+                try:
+                    callback(index, position)
+                except:
+                    self.msg += f'\U000026A0 Error in the callback of stage waypoint {index}\n'
+
+    def _stage_moveby(self, y, x, velocity, proceed=None):
+        """
+        Move by y, x (µm), Y axis first, and return the new (y, x) position in µm once the stage has stopped.
+        Distances below half a microstep are skipped.
+
+        proceed: callable or None
+            checked before each axis move, the remaining axes are skipped once it returns False (move cancelled and stage halted).
+            The check and the start of the move hold _stage_queuelock, so a canceller changing what proceed returns
+            under that lock and halting afterwards never misses an axis.
+        """
+        half_step = self.MicroStepSize/2
+        for distance, move in ((y, self.stage_moveY), (x, self.stage_moveX)):
+            if abs(distance) < half_step:
+                continue
+            with self._stage_queuelock:
+                if proceed is not None and not proceed():
+                    break
+                move(distance, velocity)
+            self.stage_wait()
+        self.stage_getcurrentposition()
+        return tuple(self.stage_YXposition)
 
     def stage_moveYX(self, y, x, velocity):
         """
@@ -226,12 +470,14 @@ class MCL_MicroDrive():
         x = float(x*1e-3) #convert into mm
         y = float(y*1e-3)
         try:
-            errorNum = self.MCLMicroDriveDll.MCL_MDMoveThreeAxes(ctypes.c_uint(2),ctypes.c_double(velocity), ctypes.c_double(x),
-                                                ctypes.c_uint(1),ctypes.c_double(velocity), ctypes.c_double(y),
-                                                ctypes.c_uint(3),ctypes.c_double(velocity), ctypes.c_double(0), self.stage_handle)
+            with self._stage_lock:
+                self._stage_velocity.value = velocity
+                self._stage_Xdistance.value = x
+                self._stage_Ydistance.value = y
+                errorNum = self.MCLMicroDriveDll.MCL_MDMoveThreeAxes(2, self._stage_velocity, self._stage_Xdistance, 1, self._stage_velocity, self._stage_Ydistance,
+                    3, self._stage_velocity, self._stage_Zdistance, self.stage_handle)
             if errorNum != 0:
                 self.msg += '\n\n\U000026A0 Error while moving: ' + self.errorDictionary[errorNum]
-            del errorNum           
             self.stage_getcurrentposition() #update current position to self.stage_YXposition variable 
         except:
             self.msg += '\n\n\U000026A0 Error: Invalid entry for moving stage or connection lost!'
@@ -243,10 +489,12 @@ class MCL_MicroDrive():
         """        
         y = float(y*1e-3) #convert into mm
         try:
-            errorNum = self.MCLMicroDriveDll.MCL_MDMove(ctypes.c_uint(1),ctypes.c_double(velocity), ctypes.c_double(y), self.stage_handle)
+            with self._stage_lock:
+                self._stage_velocity.value = velocity
+                self._stage_Ydistance.value = y
+                errorNum = self.MCLMicroDriveDll.MCL_MDMove(1, self._stage_velocity, self._stage_Ydistance, self.stage_handle)
             if errorNum != 0:
                 self.msg += '\n\n\U000026A0 Error while moving: ' + self.errorDictionary[errorNum]
-            del errorNum 
         except:
             self.msg += '\n\n\U000026A0 Error in moving stage along Y-axis/axis-1 or connection lost!'
 
@@ -257,10 +505,12 @@ class MCL_MicroDrive():
         """        
         x = float(x*1e-3) #convert into mm
         try:
-            errorNum = self.MCLMicroDriveDll.MCL_MDMove(ctypes.c_uint(2),ctypes.c_double(velocity), ctypes.c_double(x), self.stage_handle)
+            with self._stage_lock:
+                self._stage_velocity.value = velocity
+                self._stage_Xdistance.value = x
+                errorNum = self.MCLMicroDriveDll.MCL_MDMove(2, self._stage_velocity, self._stage_Xdistance, self.stage_handle)
             if errorNum != 0:
                 self.msg += '\n\n\U000026A0 Error while moving: ' + self.errorDictionary[errorNum]
-            del errorNum            
         except:
             self.msg += '\n\n\U000026A0 Error in moving stage along X-axis/axis-2 or connection lost!'
 
@@ -271,10 +521,9 @@ class MCL_MicroDrive():
             -1: move reverse       
         """        
         try:
-            errorNum = self.MCLMicroDriveDll.MCL_MDSingleStep(ctypes.c_uint(1),ctypes.c_int(direction), self.stage_handle)
+            errorNum = self.MCLMicroDriveDll.MCL_MDSingleStep(1, direction, self.stage_handle)
             if errorNum != 0:
                 self.msg += '\n\n\U000026A0 Error while single stepping along Y: ' + self.errorDictionary[errorNum]
-            del errorNum            
         except:
             self.msg += '\n\n\U000026A0 Error in single stepping stage along Y-axis/axis-1 or connection lost!'
 
@@ -285,14 +534,107 @@ class MCL_MicroDrive():
             -1: move reverse       
         """        
         try:
-            errorNum = self.MCLMicroDriveDll.MCL_MDSingleStep(ctypes.c_uint(2),ctypes.c_int(direction), self.stage_handle)
+            errorNum = self.MCLMicroDriveDll.MCL_MDSingleStep(2, direction, self.stage_handle)
             if errorNum != 0:
                 self.msg += '\n\n\U000026A0 Error while single stepping along X: ' + self.errorDictionary[errorNum]
-            del errorNum             
         except:
             self.msg += '\n\n\U000026A0 Error in single stepping stage along X-axis/axis-2 or connection lost!'
     
 
+class AsyncStage():
+    """
+    An asyncio facade over a connected MCL_MicroDrive object, e.g. to overlap stage motion with DAQ work in a scan:
+        stage = AsyncStage(mcl_stage)
+        await stage.move_by(100.0, 0.0, 2.0)
+        await asyncio.gather(stage.move_to(0.0, 0.0, 2.0), load_next_signal())
+    The end of a move is detected by MCL_MicroDriveWait on one dedicated executor thread, so the event loop never blocks
+    or polls, and moves run one after the other. Cancelling a move (task.cancel(), asyncio.wait_for timeout) halts the stage
+    (MCL_MDStop) and skips the axis not moved yet. Errors get reported in the msg of the stage object, as for the
+    MCL_MicroDrive functions. Needs Python 3.7+ (asyncio.get_running_loop).
+
+    List of functions:
+    - move_by
+    - move_to
+    - position
+    - halt
+    - close
+
+    stage: MCL_MicroDrive
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.executor = concurrent.futures.ThreadPoolExecutor(1) #the only thread blocking in MCL_MicroDriveWait
+        self.generation = 0 #incremented by halt, moves started before skip their remaining axes
+
+    async def move_by(self, y, x, velocity):
+        """
+        Move by y, x (µm) and return the new (y, x) position in µm once the stage has stopped.
+        The axes move one after the other (Y first), as with stage_moveY/stage_moveX. Distances below half a microstep are skipped.
+
+        velocity: float (in mm/s)
+        """
+        return await self._run(self._move, y, x, velocity)
+
+    async def move_to(self, y, x, velocity):
+        """
+        Move to the position y, x (µm, as in stage_YXposition) and return the new (y, x) position once the stage has stopped
+
+        velocity: float (in mm/s)
+        """
+        return await self._run(self._move_to, y, x, velocity)
+
+    async def position(self):
+        """
+        Returns the current (y, x) position in µm (waits for a running move to finish)
+        """
+        return await self._run(self._position)
+
+    def halt(self):
+        """
+        Halt the stage right away (MCL_MDStop), a running move then returns where the stage stopped
+        without moving its remaining axis, moves awaiting the executor do not move at all
+        """
+        with self.stage._stage_queuelock:
+            self.generation += 1
+        self.stage.stage_halt()
+
+    def close(self):
+        """
+        Release the executor thread once the last move has finished
+        """
+        self.executor.shutdown(wait=False)
+
+    async def _run(self, func, *args):
+        """
+        Run a blocking stage function on the executor thread. If the awaiting task gets cancelled, the stage gets halted
+        and the function allowed to return (MCL_MicroDriveWait returns once the stage stopped) before re-raising.
+        """
+        future = asyncio.get_running_loop().run_in_executor(self.executor, func, self.generation, *args)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            self.halt()
+            try:
+                await asyncio.shield(future)
+            except asyncio.CancelledError:
+                pass #cancelled again, the executor thread still finishes on its own
+            raise
+
+    def _move(self, generation, y, x, velocity):
+        return self.stage._stage_moveby(y, x, velocity, lambda: generation == self.generation)
+
+    def _move_to(self, generation, y, x, velocity):
+        current_y, current_x = self._position(generation)
+        return self._move(generation, y - current_y, x - current_x, velocity)
+
+    def _position(self, generation):
+        self.stage.stage_getcurrentposition()
+        return tuple(self.stage.stage_YXposition)
+
+
 #if being used as a module, then import required libraries
 if __name__ != "main":
-    import ctypes, time, pathlib, os, emoji
+    import ctypes, time, pathlib, os, threading, emoji
+    import numpy as np
+    import asyncio, concurrent.futures
@@ -0,0 +1,453 @@
+"""
+Waveform functions for DAQ signals.
+
+Signals are kept in a compact form: each channel is a short base period (or a staircase of levels) 
+along with a repeat count. Channels are expanded into DAC codes only when written to the final interleaved buffer,
+so memory used while calculating a signal scales with one period instead of the whole scan window.
+
+MIT License
+
+Copyright (c) 2021 Manish Kumar
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import numpy as np
+import collections
+from crossbill.camera import G2_FLYBACK_FRACTION
+
+def volts_to_codes(volts, out=None):
+    """
+    Convert voltages to 16-bit DAC codes (+/-10 V output range) in a single numpy pass.
+    We need bit value for voltage V. This is 32768 + V*3061.8 Or, 2^15*(1+V/Vmax) where Vmax = 10.7 volts
+
+    volts: numpy array (float)
+        voltage samples. Note: the array is used as scratch space and gets overwritten
+    out: numpy array (uint16) or None
+        destination of the codes (e.g. a view of the windows buffer). A new array is returned if None
+    """
+    volts *= 3061.8
+    volts += 32768
+    np.around(volts, out=volts)
+    np.clip(volts, 0, 65535, out=volts) #out of range codes would otherwise wrap around
+    if out is None:
+        return volts.astype(np.uint16)
+    out[...] = volts
+    return out
+
+#full set of parameters defining a DAQ signal (see build_waveform)
+WaveformParams = collections.namedtuple('WaveformParams', ['V1_range', 'V1_offset', 'VPS', 'V2_range', 'V2_offset', 'FPS', 'V4', 'points_per_ramp', 'activetrigger_option', 'sweep_rate', 'reverse_readout', 'max_daq_rate'])
+
+def trigger_period(points_per_exposure, activetrigger_option):
+    """
+    Single exposure period (in volts) of the camera trigger signal (Ch2)
+
+    points_per_exposure: int
+    activetrigger_option: bool
+        True: 5 V TTL high for the first half of the exposure
+        False: zeros / no cam trigger
+    """
+    if activetrigger_option:
+        points_high = int(points_per_exposure/2-1)
+        return np.hstack(( np.zeros(1), 5.0*np.ones(points_high),np.zeros(points_per_exposure-1-points_high) )) #odd lengths get the extra low point
+    else:
+        return np.zeros(points_per_exposure)
+
+def g1_flyback(levels, points_down, out=None):
+    """
+    Flyback part of the G1 staircase: linear ramp of points_down points from each level to the next one.
+    The last level flies back to the first one.
+    Same arithmetic as np.linspace (start + k*step, with exact stop value at the end) evaluated level by level.
+
+    levels: numpy array (float)
+    points_down: int
+    out: numpy array (float) of shape (len(levels), points_down) or None
+        destination, e.g. a strided view of the interleaved buffer. A new array is returned if None
+
+    Returns a numpy array of shape (len(levels), points_down)
+    """
+    flyback = np.empty((len(levels), points_down)) if out is None else out
+    nextlevels = np.roll(levels, -1)
+    if points_down > 1:
+        step = (nextlevels - levels)/(points_down - 1)
+        np.multiply(np.arange(points_down, dtype=float), step[:, None], out=flyback)
+        flyback += levels[:, None]
+        flyback[:, -1] = nextlevels
+    elif points_down == 1:
+        flyback[:, 0] = levels
+    return flyback
+
+def g1_staircase(levels, points_up, points_down, out=None):
+    """
+    Staircase signal for the G1 galvo (Ch0) built in a few broadcast operations.
+    Each level (image plane) is held for points_up points, followed by a linear flyback of points_down points 
+    to the next level. The last level flies back to the first one.
+    Output is point for point identical to np.hstack((np.repeat(...), np.linspace(...))) evaluated plane by plane.
+
+    levels: numpy array (float)
+        G1 voltage of each image plane
+    points_up: int
+    points_down: int
+    out: numpy array (float) of length len(levels)*(points_up + points_down) or None
+        destination, e.g. a strided view of the interleaved buffer. A new array is returned if None
+    """
+    if out is None:
+        out = np.empty(len(levels)*(points_up + points_down))
+    if points_up + points_down == 0:
+        return out
+    staircase = _as_periods(out, points_up + points_down)
+    staircase[:, :points_up] = levels[:, None]
+    g1_flyback(levels, points_down, out=staircase[:, points_up:])
+    return out
+
+def _as_periods(out, period_length):
+    """
+    2D view (periods x period_length) of a 1D (possibly strided) array. Raises an error instead of copying.
+    """
+    view = out.view()
+    view.shape = (len(out)//period_length, period_length)
+    return view
+
+def _write_signal(volts, out):
+    """
+    Write voltages into out, converting them to DAC codes unless out is a float (volts) buffer.
+    volts is broadcast to the shape of out and gets overwritten during the conversion.
+    """
+    if out.dtype.kind == 'f':
+        out[...] = volts
+    else:
+        volts_to_codes(volts, out)
+
+class PeriodicChannel:
+    """
+    A single AO channel stored as one base period (in volts) repeated a number of times,
+    plus a few single point overrides (e.g. the final zero of the laser signal).
+
+    period: numpy array (float)
+    repeats: int
+    overrides: dict {index: volts}
+        negative index counts from the end of the channel
+    """
+    def __init__(self, period, repeats, overrides=None):
+        self.period = np.asarray(period, dtype=float)
+        self.repeats = int(repeats)
+        self.overrides = dict(overrides or {})
+
+    def __len__(self):
+        return len(self.period)*self.repeats
+
+    @property
+    def nbytes(self):
+        return self.period.nbytes
+
+    def expand(self):
+        """
+        Returns the full channel signal in volts
+        """
+        signal = np.empty(len(self))
+        self.expand_into(signal)
+        return signal
+
+    def expand_into(self, out):
+        """
+        Write the full channel into out (e.g. a strided view of the interleaved buffer)
+        Only the base period gets converted, repeats are broadcast into out.
+
+        out: numpy array (uint16 for DAC codes, float32/float64 for volts)
+        """
+        _write_signal(self.period.copy(), _as_periods(out, len(self.period)))
+        for index, value in self.overrides.items():
+            _write_signal(np.array(value, dtype=float), out[index:index+1 or None])
+
+class StaircaseChannel:
+    """
+    A G1 galvo channel stored as its staircase levels (one per image plane), see g1_staircase.
+
+    levels: numpy array (float)
+    points_up: int
+    points_down: int
+    """
+    def __init__(self, levels, points_up, points_down):
+        self.levels = np.asarray(levels, dtype=float)
+        self.points_up = int(points_up)
+        self.points_down = int(points_down)
+
+    def __len__(self):
+        return len(self.levels)*(self.points_up + self.points_down)
+
+    @property
+    def nbytes(self):
+        return self.levels.nbytes
+
+    def expand(self):
+        """
+        Returns the full channel signal in volts
+        """
+        return g1_staircase(self.levels, self.points_up, self.points_down)
+
+    def expand_into(self, out):
+        """
+        Write the full channel into out (e.g. a strided view of the interleaved buffer)
+        Volts are written directly; for DAC codes only the levels and the flyback (~4% of the channel) go through a float scratch array.
+
+        out: numpy array (uint16 for DAC codes, float32/float64 for volts)
+        """
+        if out.dtype.kind == 'f':
+            g1_staircase(self.levels, self.points_up, self.points_down, out=out)
+            return
+        planes = _as_periods(out, self.points_up + self.points_down)
+        _write_signal(self.levels.copy()[:, None], planes[:, :self.points_up])
+        _write_signal(g1_flyback(self.levels, self.points_down), planes[:, self.points_up:])
+
+class Waveform:
+    """
+    Compact representation of the interleaved AO signal of all channels.
+
+    channels: list of PeriodicChannel/StaircaseChannel
+        all of the same length, in the order of AO channels (Ch0, Ch1, ...)
+    daq_rate: int
+        number of D/A point output per second per channel
+    """
+    def __init__(self, channels, daq_rate):
+        if len(set(len(channel) for channel in channels)) != 1:
+            raise ValueError('All channels of a waveform must have the same length')
+        self.channels = list(channels)
+        self.daq_rate = daq_rate
+
+    @property
+    def num_points(self):
+        """
+        Total number of points in the interleaved signal
+        """
+        return len(self.channels)*len(self.channels[0])
+
+    @property
+    def nbytes(self):
+        return sum(channel.nbytes for channel in self.channels)
+
+    def expand(self, dtype=float):
+        """
+        Returns the interleaved signal in volts, merged in alternate fashion: 1,2,3,4,  1,2,3,4, ...
+        The buffer is allocated once and every channel is written directly into it.
+
+        dtype: numpy float dtype (float64 or float32)
+        """
+        signals = np.empty(self.num_points, dtype=dtype)
+        self.expand_into(signals)
+        return signals
+
+    def expand_into(self, buffer):
+        """
+        Write all channels into the preallocated interleaved buffer, each channel directly into its strided view.
+        No full-length temporary is created, whatever the scan window.
+
+        buffer: numpy array of length self.num_points
+            uint16: DAC codes (e.g. the windows buffer); float32/float64: volts
+        """
+        if len(buffer) != self.num_points:
+            raise ValueError('Buffer of %d points cannot hold a waveform of %d points' %(len(buffer), self.num_points))
+        num_channels = len(self.channels)
+        for i, channel in enumerate(self.channels):
+            channel.expand_into(buffer[i::num_channels])
+
+    def subset(self, channels):
+        """
+        Returns a Waveform of some of the channels only (no copies), e.g. the channels output by one of several DAQ boards
+
+        channels: sequence of int
+            channel indices, in the order of AO channels of the new waveform
+        """
+        return Waveform([self.channels[i] for i in channels], self.daq_rate)
+
+def build_waveform(V1_range, V1_offset, VPS, V2_range, V2_offset, FPS, V4, points_per_ramp, activetrigger_option, sweep_rate=80, reverse_readout=False, max_daq_rate=96000):
+    """
+    A function to calculate the AO signals for all four channels in a compact (period-compressed) form.
+    Note: DSLM timing comes from the camera rolling shutter, see crossbill.camera.CameraProfile.sweep_rate
+    The defaults match the Prime95B (10 µs per width pixel, 80 Hz DSLM)
+
+    V1_range: float
+    V1_offset: float
+    VPS: float/int
+    V2_range: float
+    V2_offset: float
+    FPS: int
+    V4: float
+    points_per_ramp: int     
+    activetrigger_option: bool
+    sweep_rate: int
+        DSLM sweep rate in Hz, an integer multiple of FPS
+    reverse_readout: bool
+        True if the camera rolling shutter runs in reverse direction (G2 ramps are swapped)
+    max_daq_rate: int
+        highest AO rate per channel of the DAQ board (see crossbill.daq.BOARD_CAPABILITIES)
+
+    Ch0: V1_range, V1_offset and VPS define the signal going to G1 galvo for lateral sweep of light-sheet
+    Ch1: V2_range, V2_offset, sweep_rate (camera sensor read speed) and points_per_ramp define the signal going to G2 galso for DSLM style light-sheet creation        
+    Ch2: FPS and activetrigger_option define TTL signal for Camera frame-rate control
+    Ch3: V4 defines the voltage signal controlling laser selection and on/off duration
+    points_per_ramp dictates how many points make up single ramp signal for G2
+
+    Returns a Waveform. Its daq_rate may be lower than requested by points_per_ramp due to the DAQ board limit
+    (MCCdaq.daq_optimize_rate picks points_per_ramp within the limit beforehand).
+    """
+
+    if sweep_rate < FPS or sweep_rate % FPS:
+        raise ValueError('DSLM sweep rate (%s Hz) must be an integer multiple of FPS (%s)' %(sweep_rate, FPS))
+
+    #limit V1 and V2 signals
+    V1_min = max(V1_offset - V1_range/2, -10)
+    V1_max = min(V1_offset + V1_range/2, +10)
+    V2_min = max(V2_offset - V2_range/2, -10)
+    V2_max = min(V2_offset + V2_range/2, +10)
+
+    daq_rate = points_per_ramp*sweep_rate #number of D/A point output per second per channel
+    if daq_rate > max_daq_rate:
+        daq_rate = max_daq_rate 
+        points_per_ramp = int(daq_rate/sweep_rate) #galvo specific for DSLM
+        daq_rate = points_per_ramp*sweep_rate #keep a whole number of points per sweep
+    points_per_exposure = int(daq_rate/FPS) #Camera trigger specific for number of planes
+    num_imageplanes = round(FPS/VPS) # number of oblique image planes per sweep
+    points_down_ramp = int(points_per_ramp*G2_FLYBACK_FRACTION) # number of points in down-ramp (this is opposite rolling shutter direction)
+    points_up_ramp = points_per_ramp - points_down_ramp # number of points in up-ramp (this is along rolling shutter direction)
+    if reverse_readout:
+        V2_min, V2_max = V2_max, V2_min #up-ramp follows the rolling shutter
+    upramp = np.linspace(V2_min,V2_max,points_up_ramp,endpoint=True)
+    downramp = np.linspace(V2_max,V2_min,points_down_ramp,endpoint=True)
+    sweeps_per_exposure = int(sweep_rate/FPS)
+    if VPS < 1:
+        time = round(1/VPS) #total time for D/A points to output                 
+        ramp = np.linspace(V1_max, V1_min, num_imageplanes, endpoint=True)
+        signal1 = StaircaseChannel(ramp, points_up_ramp*sweeps_per_exposure, points_down_ramp*sweeps_per_exposure) #Ch0: light-sheet lateral sweep (SOPi) galvo signal 
+        signal2 = PeriodicChannel(np.hstack(( upramp,downramp )), sweep_rate*time) #Ch1: DSLM galvo signal
+        signal3 = PeriodicChannel(trigger_period(points_per_exposure, activetrigger_option), FPS*time) #Ch2: Cam trigger
+        signal4 = PeriodicChannel([V4], daq_rate*time, {-1: 0}) #Ch3: end with a zero voltage to signal off
+    else:
+        ramp = np.linspace(V1_min, V1_max, num_imageplanes, endpoint=True)
+        signal1 = StaircaseChannel(ramp, points_up_ramp*sweeps_per_exposure, points_down_ramp*sweeps_per_exposure) #Ch0: G1 for light-sheet sweep
+        signal2 = PeriodicChannel(np.hstack(( upramp,downramp )), num_imageplanes*sweeps_per_exposure) #Ch1: G2 for DSLM
+        signal3 = PeriodicChannel(trigger_period(points_per_exposure, activetrigger_option), num_imageplanes) #Ch2: Cam trigger
+        signal4 = PeriodicChannel([V4], int(daq_rate/VPS), {-1: 0}) #Ch3: end with a zero voltage to signal off
+    return Waveform([signal1, signal2, signal3, signal4], daq_rate)
+
+def waveform_chunks(waveforms):
+    """
+    DAC codes of a sequence of waveforms (e.g. a generator of time-varying volumes), one chunk per waveform.
+    Waveforms are expanded one at a time, so memory use does not grow with the length of the sequence.
+    Meant as the source of MCCdaq.daq_stream_signals.
+
+    waveforms: iterable of Waveform
+    """
+    for waveform in waveforms:
+        codes = np.empty(waveform.num_points, dtype=np.uint16)
+        waveform.expand_into(codes)
+        yield codes
+
+def patch_laser(codes, V4, num_channels=4):
+    """
+    Rewrite the laser signal (Ch3, see build_waveform) of interleaved DAC codes in place. Other channels stay untouched.
+
+    codes: numpy array (uint16)
+    V4: float
+    """
+    on_code, off_code = volts_to_codes(np.array([V4, 0.0]))
+    channel = codes[3::num_channels]
+    channel[:] = on_code
+    channel[-1] = off_code #end with a zero voltage to signal off
+
+def patch_trigger(codes, points_per_exposure, activetrigger_option, num_channels=4):
+    """
+    Rewrite the camera trigger signal (Ch2, see build_waveform) of interleaved DAC codes in place. Other channels stay untouched.
+
+    codes: numpy array (uint16)
+    points_per_exposure: int
+        daq_rate/FPS
+    activetrigger_option: bool
+    """
+    period = volts_to_codes(trigger_period(points_per_exposure, activetrigger_option))
+    codes[2::num_channels].reshape(-1, points_per_exposure)[:] = period #strided view, no copy of the buffer
+
+def expand_to_shared_memory(params, shm_name):
+    """
+    Process pool worker: build the waveform of params (WaveformParams) and write its DAC codes into an existing
+    multiprocessing.shared_memory block of the parent process (2*num_points bytes). Returns the DAQ rate.
+    """
+    from multiprocessing import shared_memory
+    waveform = build_waveform(*params)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        codes = np.ndarray(waveform.num_points, dtype=np.uint16, buffer=shm.buf)
+        waveform.expand_into(codes)
+        del codes #no view of the block may remain when closing it
+    finally:
+        shm.close()
+    return waveform.daq_rate
+
+def select_channels(codes, num_channels, channels, out=None):
+    """
+    Returns the interleaved signal of some of the channels of an interleaved signal, e.g. the part output by one of several DAQ boards
+
+    codes: numpy array
+        interleaved signal of num_channels channels
+    channels: sequence of int
+        channels to keep, in the order of the new signal
+    out: numpy array or None
+        destination of len(codes)//num_channels*len(channels) points, e.g. a windows buffer. A new array is returned if None
+    """
+    frames = codes.reshape(-1, num_channels)
+    if out is None:
+        out = np.empty(len(frames)*len(channels), dtype=codes.dtype)
+    out = out.reshape(-1, len(channels))
+    for i, channel in enumerate(channels):
+        out[:, i] = frames[:, channel]
+    return out.ravel()
+
+class CodeStream:
+    """
+    Reads a stream of interleaved DAC code chunks of any length into fixed size blocks (e.g. halves of a circular buffer).
+    Once the stream ends, blocks are padded with 0 V.
+
+    chunks: iterable of numpy arrays (uint16)
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = np.empty(0, dtype=np.uint16) #left over part of the last chunk
+        self.exhausted = False
+        self.points = 0 #points read from the stream so far (without the 0 V padding)
+
+    def fill(self, out):
+        """
+        Write the next len(out) points of the stream into out.
+        Returns False if the stream ended before out was full (the rest of out is set to 0 V).
+
+        out: numpy array (uint16)
+        """
+        filled = 0
+        while filled < len(out):
+            if len(self.pending) == 0:
+                try:
+                    self.pending = np.asarray(next(self.chunks), dtype=np.uint16).ravel()
+                except StopIteration:
+                    self.exhausted = True
+                    out[filled:] = 32768 #0 V code
+                    return False
+            num = min(len(out) - filled, len(self.pending))
+            out[filled:filled + num] = self.pending[:num]
+            self.pending = self.pending[num:]
+            filled += num
+            self.points += num
+        return True
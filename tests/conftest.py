@@ -0,0 +1,6 @@
+"""
+Tests run against the sources in src/ (no install needed). DAQ tests run on the simulated board (crossbill.daqsim).
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ['CROSSBILL_DAQ'] = 'sim' #set before crossbill.daq gets imported
@@ -0,0 +1,65 @@
+"""
+Windows buffer pool of MCCdaq (DAQBufferPool) on the simulated board: a buffer still being output is never freed
+"""
+import pytest
+pytest.importorskip('mcculw.enums') #enums shared with the simulated board
+from crossbill import daq, daqsim
+
+class SimDAQ(daq.MCCdaq):
+    def __init__(self):
+        self.msg = ''
+        daq.MCCdaq.__init__(self)
+
+@pytest.fixture
+def board(monkeypatch):
+    daqsim.configure()
+    daq.use_backend(daqsim)
+    freed = []
+    win_buf_free = daqsim.win_buf_free
+    def record_free(memhandle):
+        freed.append(memhandle)
+        win_buf_free(memhandle)
+    monkeypatch.setattr(daqsim, 'win_buf_free', record_free)
+    device = SimDAQ()
+    device.daq_connectboard(0)
+    device.daq_store = None
+    yield device, freed
+    device.daq_disconnect()
+
+def load(device, V1_range, VPS=1):
+    device.daq_load_signals(V1_range, 0.5, VPS, 2.0, -0.3, 40, 1.5, 200, True)
+    assert device.daq_loadmode == 'generated'
+
+def test_running_buffer_not_freed_on_reload(board):
+    device, freed = board
+    device.daq_pool.resize(0) #every idle buffer is over budget
+    load(device, 3.0)
+    device.daq_push_signals(True) #looping
+    running = device.memhandle
+    assert device.daq_isrunning()
+    load(device, 2.0, VPS=0.5) #new signal (of another size: no hot swap) prepared while the old one keeps being output
+    assert device.daq_isrunning()
+    assert running not in freed
+    assert device.memhandle != running
+    device.daq_terminate_signal() #scan stopped: the old buffer can go now
+    assert running in freed
+    assert device.memhandle not in freed
+
+def test_stopped_buffer_reused(board):
+    device, freed = board
+    load(device, 3.0)
+    first = device.memhandle
+    load(device, 2.0) #not running: same size buffer is reused
+    assert device.memhandle == first
+    assert freed == []
+
+def test_pool_pending_release():
+    daqsim.configure()
+    daq.use_backend(daqsim)
+    pool = daq.DAQBufferPool(max_bytes=0)
+    memhandle = pool.acquire(100)
+    pool.release(memhandle, running=True)
+    assert pool.acquire(100) != memhandle #not reused while it may still be read
+    assert len(pool) == 2
+    pool.settle()
+    assert len(pool) == 1 #freed (over budget) once settled
@@ -0,0 +1,31 @@
+"""
+Streaming of the loaded signal (MCCdaq.daq_push_sweeps) on the simulated board
+"""
+import time
+import pytest
+pytest.importorskip('mcculw.enums') #enums shared with the simulated board
+from crossbill import daq, daqsim
+
+class SimDAQ(daq.MCCdaq):
+    def __init__(self):
+        self.msg = ''
+        daq.MCCdaq.__init__(self)
+
+@pytest.fixture
+def board():
+    daqsim.configure()
+    daq.use_backend(daqsim)
+    device = SimDAQ()
+    device.daq_connectboard(0)
+    device.daq_store = None
+    yield device
+    device.daq_disconnect()
+
+def test_push_sweeps_ends_with_the_last_sweep(board):
+    board.daq_load_signals(3.0, 0.5, 1, 2.0, -0.3, 40, 1.5, 200, True)
+    start = time.monotonic()
+    assert board.daq_push_sweeps(2)
+    assert board.daq_wait(5)
+    #2 s of signal ending on a half of the 1 s circular buffer: no 0.5 s of 0 V padding played before the end
+    assert time.monotonic() - start < 2.3
+    assert not board.daq_isrunning()
@@ -0,0 +1,26 @@
+"""
+Scan-path planning (crossbill.scanplan): mosaic size within the stage limits and tile order
+"""
+from crossbill import scanplan
+
+def test_tiles_within_whole_multiple():
+    assert scanplan.tiles_within(0, 300, 100) == 3
+    assert scanplan.tiles_within(-0.1, 0.2, 0.1) == 3 #float noise
+
+def test_tiles_within_remainder_stays_inside():
+    #250 µm between the limits, 100 µm tiles: a third tile would run to 300 µm, past the positive limit
+    y_start, ypos_lim, step = 1000.0, 1250.0, 100
+    y_tiles = scanplan.tiles_within(y_start, ypos_lim, step)
+    assert y_tiles == 2
+    tiles = scanplan.plan('serpentine', y_start, 0.0, step, 100, y_tiles, 1)
+    assert max(tile.y for tile in tiles) + step <= ypos_lim
+
+def test_tiles_within_at_least_one():
+    assert scanplan.tiles_within(0, 50, 100) == 1
+
+def test_plan_covers_mosaic():
+    for order in scanplan.PLANNERS:
+        tiles = scanplan.plan(order, 0.0, 0.0, 10, 20, 3, 4)
+        assert [tile.index for tile in tiles] == list(range(12))
+        assert sorted((tile.row, tile.column) for tile in tiles) == [(row, column) for row in range(3) for column in range(4)]
+        assert all((tile.y, tile.x) == (tile.row*10, tile.column*20) for tile in tiles)